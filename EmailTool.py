@@ -1,13 +1,16 @@
-import os
-import base64
-from email.mime.text import MIMEText
 from pydantic import BaseModel, Field
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 from portia.errors import ToolHardError, ToolSoftError
 from portia.tool import Tool, ToolRunContext
+from backends import BackendError, email_backend
+from google_batch import DEFAULT_BATCH_SIZE
+from google_clients import get_client_manager
+from metrics import traced
+from outbox import DONE, get_outbox
+
+SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
+
+REMINDER_SUBJECT = "Your Appointment Reminder"
+REMINDER_BODY = "Dear Patient,\n\nThis is a reminder for your upcoming appointment.\nDate: To be confirmed\nTime: To be confirmed\n\nBest regards,\nYour Clinic"
 
 class EmailToolSchema(BaseModel):
     email: str = Field(..., description="The email address of the patient")
@@ -20,47 +23,72 @@ class EmailTool(Tool[str]):
     output_schema: tuple[str, str] = ("str", "String output of the email sent")
 
     def _get_gmail_service(self):
-        """Set up and return Google Gmail API service."""
-        SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
-        creds = None
-        # Check for existing credentials
-        if os.path.exists("token_email.json"):
-            creds = Credentials.from_authorized_user_file("token_email.json", SCOPES)
-        # If no valid credentials, prompt user to log in
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                if not os.path.exists("credentials.json"):
-                    raise ToolHardError("credentials.json is required for Google Gmail API")
-                flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-                creds = flow.run_local_server(port=0)
-                # Save credentials for future runs
-                with open("token_email.json", "w") as token:
-                    token.write(creds.to_json())
-        return build("gmail", "v1", credentials=creds)
+        """Return the shared Google Gmail API service."""
+        return get_client_manager("token_email.json", "credentials.json", SCOPES).service("gmail", "v1")
+
+    def _get_backend(self):
+        """Return the email backend chosen by EMAIL_BACKEND (Gmail by default)."""
+        return email_backend(self._get_gmail_service)
 
+    @traced("email_tool.run")
     def run(self, _: ToolRunContext, email: str) -> str:
         """Run the Email Tool to send an appointment reminder."""
         try:
-            # Get Gmail service
-            service = self._get_gmail_service()
-
-            # Create email message
-            message = MIMEText("Dear Patient,\n\nThis is a reminder for your upcoming appointment.\nDate: To be confirmed\nTime: To be confirmed\n\nBest regards,\nYour Clinic")
-            message["to"] = email
-            message["subject"] = "Your Appointment Reminder"
-
-            # Encode message for Gmail API
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-            message_body = {"raw": raw_message}
+            # Get the email backend
+            backend = self._get_backend()
 
             # Send email
-            sent_message = service.users().messages().send(userId="me", body=message_body).execute()
+            message_id = backend.send(email, REMINDER_SUBJECT, REMINDER_BODY)
 
-            return f"Email sent to {email}. Message ID: {sent_message['id']}"
+            return f"Email sent to {email}. Message ID: {message_id}"
 
-        except HttpError as error:
+        except BackendError as error:
             raise ToolSoftError(f"Failed to send email: {error}")
         except Exception as e:
-            raise ToolHardError(f"An unexpected error occurred: {str(e)}")
\ No newline at end of file
+            raise ToolHardError(f"An unexpected error occurred: {str(e)}")
+
+    @traced("email_tool.send_bulk")
+    def send_bulk(self, _: ToolRunContext, items: list[tuple[str, str, str]], max_workers: int = 8, batch_size: int = DEFAULT_BATCH_SIZE, keys: list[str | None] | None = None) -> list:
+        """Send many (to, subject, body) emails through the email backend in batches.
+
+        `keys` optionally gives an outbox key per email (see outbox.email_key); emails
+        already recorded as sent are skipped. Returns a result string or a
+        ToolSoftError/ToolHardError per recipient, in order.
+        """
+        if not items:
+            return []
+        keys = keys or [None] * len(items)
+        outbox = get_outbox()
+        checkpoints = outbox.get_many(keys)
+        outcomes = [None] * len(items)
+        to_send = []
+        for index, key in enumerate(keys):
+            status, data = checkpoints.get(key, (None, None))
+            if status == DONE:
+                outcomes[index] = data["result"]
+            else:
+                to_send.append(index)
+        if not to_send:
+            return outcomes
+
+        try:
+            backend = self._get_backend()
+        except ToolHardError:
+            raise
+        except Exception as e:
+            raise ToolHardError(f"An unexpected error occurred: {str(e)}")
+
+        sent = []
+        results = backend.send_many([items[index] for index in to_send], batch_size, max_workers)
+        for index, (message_id, error) in zip(to_send, results):
+            to = items[index][0]
+            if error is None:
+                outcomes[index] = f"Email sent to {to}. Message ID: {message_id}"
+                sent.append((keys[index], {"result": outcomes[index]}))
+            elif isinstance(error, BackendError):
+                outcomes[index] = ToolSoftError(f"Failed to send email: {error}")
+            else:
+                outcomes[index] = ToolHardError(f"An unexpected error occurred: {str(error)}")
+        # Email has no idempotency key: a message sent just before a crash is sent again on resume
+        outbox.mark_many(DONE, sent)
+        return outcomes
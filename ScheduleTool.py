@@ -1,13 +1,17 @@
-import os
-from datetime import datetime, timedelta
-import httpx
+import re
+from datetime import datetime, timezone
 from pydantic import BaseModel, Field
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 from portia.errors import ToolHardError, ToolSoftError
 from portia.tool import Tool, ToolRunContext
+from backends import BackendError, calendar_backend
+from calendar_shards import get_calendar_shards
+from google_batch import DEFAULT_BATCH_SIZE
+from google_clients import get_client_manager
+from metrics import traced
+from outbox import DONE, STARTED, event_id, get_outbox
+
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+SCHEDULE_RESULT = re.compile(r"on (\d{4}-\d{2}-\d{2}) at (\d{2}:\d{2}) UTC\. Event ID: (\S+)")
 
 class ScheduleToolSchema(BaseModel):
     date: str = Field(..., description="The date to set the schedule (format: YYYY-MM-DD)")
@@ -20,58 +24,185 @@ class ScheduleTool(Tool[str]):
     output_schema: tuple[str, str] = ("str", "String output of the date scheduled")
 
     def _get_calendar_service(self):
-        """Set up and return Google Calendar API service."""
-        SCOPES = ["https://www.googleapis.com/auth/calendar"]
-        creds = None
-        # Check for existing credentials
-        if os.path.exists("token.json"):
-            creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-        # If no valid credentials, prompt user to log in
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(httpx.Request())
-            else:
-                if not os.path.exists("credentials.json"):
-                    raise ToolHardError("credentials.json is required for Google Calendar API")
-                flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-                creds = flow.run_local_server(port=0)
-                # Save credentials for future runs
-                with open("token.json", "w") as token:
-                    token.write(creds.to_json())
-        return build("calendar", "v3", credentials=creds)
+        """Return the shared Google Calendar API service."""
+        return get_client_manager("token.json", "credentials.json", SCOPES).service("calendar", "v3")
+
+    def _get_backend(self):
+        """Return the calendar backend chosen by CALENDAR_BACKEND (Google Calendar by default)."""
+        return calendar_backend(self._get_calendar_service)
+
+    @staticmethod
+    def _parse_date(date: str) -> datetime:
+        """Validate the date and return the earliest time an appointment may start on it."""
+        try:
+            event_date = datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            raise ToolSoftError(f"Invalid date format: {date}. Use YYYY-MM-DD")
+        # Never book in the past: for today, start searching from the current time (UTC)
+        return max(event_date, datetime.now(timezone.utc).replace(tzinfo=None))
+
+    @staticmethod
+    def _allocate(shard, earliest: datetime) -> tuple[datetime, datetime]:
+        """Book the next free slot on a calendar shard."""
+        try:
+            return shard.allocator.allocate(earliest)
+        except ValueError as e:
+            raise ToolSoftError(str(e))
 
+    @staticmethod
+    def _build_event(start: datetime, end: datetime, event_id: str | None = None) -> dict:
+        """Return the Calendar event body for a booked slot, with a fixed event id if given."""
+        event = {
+            "summary": "Appointment",
+            "description": "Scheduled via Scheduler Tool",
+            "start": {
+                "dateTime": start.isoformat(),
+                "timeZone": "UTC",
+            },
+            "end": {
+                "dateTime": end.isoformat(),
+                "timeZone": "UTC",
+            },
+        }
+        if event_id is not None:
+            event["id"] = event_id
+        return event
+
+    @traced("schedule_tool.run")
     def run(self, _: ToolRunContext, date: str) -> str:
-        """Run the Scheduler to create a Google Calendar event."""
+        """Run the Scheduler to create a calendar event."""
+        start = None
+        shard = get_calendar_shards().route({"date": date})
         try:
-            # Validate and parse date
-            try:
-                event_date = datetime.strptime(date, "%Y-%m-%d")
-            except ValueError:
-                raise ToolSoftError(f"Invalid date format: {date}. Use YYYY-MM-DD")
-
-            # Get Google Calendar service
-            service = self._get_calendar_service()
-
-            # Create event
-            event = {
-                "summary": "Appointment",
-                "description": "Scheduled via Scheduler Tool",
-                "start": {
-                    "dateTime": event_date.isoformat() + "T10:00:00",
-                    "timeZone": "UTC",
-                },
-                "end": {
-                    "dateTime": (event_date + timedelta(hours=1)).isoformat() + "T11:00:00",
-                    "timeZone": "UTC",
-                },
-            }
-
-            # Insert event into primary calendar
-            created_event = service.events().insert(calendarId="primary", body=event).execute()
-
-            return f"Scheduled appointment on {date} at 10:00 UTC. Event ID: {created_event['id']}"
-
-        except HttpError as error:
+            earliest = self._parse_date(date)
+
+            # Get the calendar backend; events already on the calendar keep their slots
+            backend = self._get_backend()
+            shard.sync_once(backend)
+
+            # Insert event for the next free slot into the shard's calendar
+            start, end = self._allocate(shard, earliest)
+            event = self._build_event(start, end)
+            if backend.rate_limited:
+                shard.rate_limiter.acquire()
+            created_event = backend.insert(shard.calendar_id, event)
+            shard.mirror.record(created_event["id"], start, end, event["summary"], event["description"])
+
+            return f"Scheduled appointment on {start:%Y-%m-%d} at {start:%H:%M} UTC. Event ID: {created_event['id']}"
+
+        except ToolSoftError:
+            raise
+        except BackendError as error:
+            if start is not None:
+                shard.allocator.release(start)
             raise ToolSoftError(f"Failed to schedule event: {error}")
         except Exception as e:
-            raise ToolHardError(f"An unexpected error occurred: {str(e)}")
\ No newline at end of file
+            if start is not None:
+                shard.allocator.release(start)
+            raise ToolHardError(f"An unexpected error occurred: {str(e)}")
+
+    @traced("schedule_tool.run_batch")
+    def run_batch(self, _: ToolRunContext, dates: list[str], batch_size: int = DEFAULT_BATCH_SIZE, keys: list[str | None] | None = None, requests: list[dict] | None = None) -> list:
+        """Create one event per date using batched calendar inserts.
+
+        `requests` optionally gives the request each date books, whose CALENDAR_SHARD_KEY
+        field picks its calendar (see calendar_shards); every calendar books its share on
+        its own worker. `keys` optionally gives an outbox key per date (see
+        outbox.schedule_key). A date whose key is recorded as booked is answered from the
+        outbox, and one whose insert may have landed is retried with the same slot and
+        event id, so a rerun never creates a duplicate event. Returns a result string or
+        a ToolSoftError/ToolHardError for each date, in order.
+        """
+        keys = keys or [None] * len(dates)
+        requests = requests or [{"date": date} for date in dates]
+        shards = get_calendar_shards()
+        checkpoints = get_outbox().get_many(keys)
+        outcomes = [None] * len(dates)
+        groups = {}
+        for index, date in enumerate(dates):
+            shard = shards.route(requests[index])
+            status, data = checkpoints.get(keys[index], (None, None))
+            if status == DONE:
+                # Booked by an earlier run; keep its slot taken in this process too
+                if data.get("calendar", "primary") == shard.calendar_id:
+                    shard.allocator.reserve(datetime.fromisoformat(data["start"]))
+                outcomes[index] = data["result"]
+                continue
+            try:
+                groups.setdefault(shard, []).append((index, self._parse_date(date)))
+            except ToolSoftError as error:
+                outcomes[index] = error
+        if not groups:
+            return outcomes
+
+        try:
+            backend = self._get_backend()
+        except Exception as e:
+            raise ToolHardError(f"An unexpected error occurred: {str(e)}")
+
+        futures = [shard.submit(self._book_on_shard, backend, group, keys, checkpoints, batch_size) for shard, group in groups.items()]
+        for future in futures:
+            for index, outcome in future.result():
+                outcomes[index] = outcome
+        return outcomes
+
+    def _book_on_shard(self, shard, backend, group: list[tuple[int, datetime]], keys: list[str | None], checkpoints: dict, batch_size: int) -> list:
+        """Book (index, earliest start) pairs on one calendar within its rate budget; returns (index, outcome) pairs."""
+        try:
+            shard.sync_once(backend)
+        except BackendError as error:
+            return [(index, ToolSoftError(f"Failed to read calendar {shard.calendar_id}: {error}")) for index, _ in group]
+        except Exception as e:
+            return [(index, ToolHardError(f"An unexpected error occurred: {str(e)}")) for index, _ in group]
+
+        outcomes = []
+        pending = []
+        for index, earliest in group:
+            status, data = checkpoints.get(keys[index], (None, None))
+            if status == STARTED and data.get("calendar", "primary") == shard.calendar_id:
+                # The insert may have landed before the last run stopped: retry the same slot and event id
+                start = datetime.fromisoformat(data["start"])
+                shard.allocator.reserve(start)
+                pending.append((index, start, start + shard.allocator.slot_length))
+                continue
+            try:
+                pending.append((index, *self._allocate(shard, earliest)))
+            except ToolSoftError as error:
+                outcomes.append((index, error))
+        events = [self._build_event(start, end, event_id(shard.calendar_id, keys[index]) if keys[index] else None) for index, start, end in pending]
+        outbox = get_outbox()
+        # The same payload as chatbot_tools.ScheduleTool writes, since both share the outbox
+        outbox.mark_many(STARTED, [
+            (keys[index], {"calendar": shard.calendar_id, "start": start.isoformat(), "event_id": event.get("id")})
+            for (index, start, _), event in zip(pending, events)
+        ])
+        if backend.rate_limited:
+            shard.rate_limiter.acquire(len(events))
+        booked = []
+        forget = []
+        for (index, start, end), event, (created_event, error) in zip(pending, events, backend.insert_many(shard.calendar_id, events, batch_size)):
+            # A 409 for our own event id means an earlier attempt already created it
+            if error is None or keys[index] and isinstance(error, BackendError) and error.status == 409:
+                booked_id = created_event["id"] if error is None else event["id"]
+                result = f"Scheduled appointment on {start:%Y-%m-%d} at {start:%H:%M} UTC. Event ID: {booked_id}"
+                shard.mirror.record(booked_id, start, end, event["summary"], event["description"])
+                booked.append((keys[index], {"calendar": shard.calendar_id, "start": start.isoformat(), "result": result}))
+                outcomes.append((index, result))
+                continue
+            shard.allocator.release(start)
+            if isinstance(error, BackendError):
+                if error.status < 500:
+                    # Calendar rejected the insert, so nothing was created and the next run starts afresh
+                    forget.append(keys[index])
+                outcomes.append((index, ToolSoftError(f"Failed to schedule event: {error}")))
+            else:
+                outcomes.append((index, ToolHardError(f"An unexpected error occurred: {str(error)}")))
+        outbox.mark_many(DONE, booked)
+        outbox.forget_many(forget)
+        return outcomes
+
+
+def parse_schedule_result(result: str) -> tuple[str, str]:
+    """Return (start time ISO string, event ID) from a ScheduleTool result."""
+    booked_date, booked_time, event_id = SCHEDULE_RESULT.search(result).groups()
+    return f"{booked_date}T{booked_time}:00", event_id
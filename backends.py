@@ -0,0 +1,334 @@
+import base64
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+
+from google_batch import DEFAULT_BATCH_SIZE, execute_batched
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CALENDAR_DB_PATH = os.path.join(BASE_DIR, "calendar.sqlite3")
+DEFAULT_EMAIL_SPOOL_DIR = os.path.join(BASE_DIR, "email_spool")
+
+# CALENDAR_BACKEND and EMAIL_BACKEND pick one of these; Google is the default for both
+CALENDAR_BACKENDS = ("google", "sqlite")
+EMAIL_BACKENDS = ("gmail", "smtp", "spool")
+SMTP_TIMEOUT = 30
+
+
+class BackendError(Exception):
+    """A backend refused a call.
+
+    `status` is the HTTP status for Google and the local calendar (409: the event id
+    already exists, 410: the sync token expired, 4xx: rejected, 5xx: try again) and
+    the reply code for SMTP.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class CalendarBackend(ABC):
+    """Where ScheduleTool books events. Events are Calendar API event resources."""
+
+    name = "calendar"
+    # Whether writes count against the per-calendar rate budget (see calendar_shards.RateLimiter)
+    rate_limited = False
+
+    def insert(self, calendar_id, event):
+        """Create one event and return it; raises BackendError if the backend refuses it."""
+        created, error = self.insert_many(calendar_id, [event])[0]
+        if error is not None:
+            raise error
+        return created
+
+    @abstractmethod
+    def insert_many(self, calendar_id, events, batch_size=DEFAULT_BATCH_SIZE):
+        """Create events, batch_size per round trip; returns (event, error) pairs in order."""
+
+    @abstractmethod
+    def list_changes(self, calendar_id, sync_token=None, time_min=None):
+        """Return (events, next sync token).
+
+        Without a token, every event ending after `time_min` (an aware datetime) is
+        listed; with one, only events changed since it was issued, cancelled ones
+        with status "cancelled". An expired token raises BackendError with status 410.
+        """
+
+
+class EmailBackend(ABC):
+    """Where EmailTool sends messages."""
+
+    name = "email"
+
+    def send(self, to, subject, body):
+        """Send one message and return its id; raises BackendError if the backend refuses it."""
+        message_id, error = self.send_many([(to, subject, body)])[0]
+        if error is not None:
+            raise error
+        return message_id
+
+    @abstractmethod
+    def send_many(self, messages, batch_size=DEFAULT_BATCH_SIZE, max_workers=8):
+        """Send (to, subject, body) messages, batch_size per round trip; returns (message id, error) pairs in order."""
+
+
+def _google_error(error):
+    from googleapiclient.errors import HttpError
+
+    if isinstance(error, HttpError):
+        return BackendError(error.resp.status, str(error))
+    return error
+
+
+def _rfc3339(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class GoogleCalendarBackend(CalendarBackend):
+    """Google Calendar through one thread's API service (see google_clients)."""
+
+    name = "google"
+    rate_limited = True
+
+    def __init__(self, service):
+        self.service = service
+
+    def insert(self, calendar_id, event):
+        from googleapiclient.errors import HttpError
+
+        try:
+            with span("google_api.calendar.insert", calendar=calendar_id):
+                return self.service.events().insert(calendarId=calendar_id, body=event).execute()
+        except HttpError as error:
+            raise _google_error(error)
+
+    def insert_many(self, calendar_id, events, batch_size=DEFAULT_BATCH_SIZE):
+        api_requests = [self.service.events().insert(calendarId=calendar_id, body=event) for event in events]
+        return [
+            (created, None if error is None else _google_error(error))
+            for created, error in execute_batched(self.service, api_requests, batch_size)
+        ]
+
+    def _list(self, params, span_name, calendar_id):
+        from googleapiclient.errors import HttpError
+
+        items = []
+        page_token = None
+        try:
+            while True:
+                page_params = dict(params, pageToken=page_token) if page_token else params
+                with span(span_name, calendar=calendar_id):
+                    page = self.service.events().list(**page_params).execute()
+                items.extend(page.get("items", []))
+                page_token = page.get("nextPageToken")
+                if not page_token:
+                    return items, page.get("nextSyncToken")
+        except HttpError as error:
+            raise _google_error(error)
+
+    def list_changes(self, calendar_id, sync_token=None, time_min=None):
+        params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": 2500}
+        if sync_token:
+            params["syncToken"] = sync_token
+        elif time_min is not None:
+            params["timeMin"] = _rfc3339(time_min)
+        return self._list(params, "google_api.calendar.sync", calendar_id)
+
+
+def encode_message(to, subject, body):
+    """Build a MIME message and encode it for the Gmail API."""
+    message = MIMEText(body)
+    message["to"] = to
+    message["subject"] = subject
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+class GmailBackend(EmailBackend):
+    """Gmail through one thread's API service; messages are encoded on a thread pool and sent in batches."""
+
+    name = "gmail"
+
+    def __init__(self, service):
+        self.service = service
+
+    def send(self, to, subject, body):
+        from googleapiclient.errors import HttpError
+
+        try:
+            with span("google_api.gmail.send"):
+                sent = self.service.users().messages().send(userId="me", body={"raw": encode_message(to, subject, body)}).execute()
+        except HttpError as error:
+            raise _google_error(error)
+        return sent["id"]
+
+    def send_many(self, messages, batch_size=DEFAULT_BATCH_SIZE, max_workers=8):
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            raw_messages = list(pool.map(lambda message: encode_message(*message), messages))
+        api_requests = [self.service.users().messages().send(userId="me", body={"raw": raw}) for raw in raw_messages]
+        return [
+            (None, _google_error(error)) if error is not None else (sent["id"], None)
+            for sent, error in execute_batched(self.service, api_requests, batch_size)
+        ]
+
+
+def build_message(to, subject, body, sender):
+    """Return a complete MIME message, with a Message-ID, for SMTP and the spool."""
+    message = MIMEText(body)
+    message["From"] = sender
+    message["To"] = to
+    message["Subject"] = subject
+    message["Date"] = formatdate(localtime=True)
+    # make_msgid() would otherwise look up this host's name on every call
+    message["Message-ID"] = make_msgid(domain=sender.rpartition("@")[2] or "localhost")
+    return message
+
+
+class SMTPBackend(EmailBackend):
+    """Any SMTP server; each batch of messages is delivered over one connection."""
+
+    name = "smtp"
+
+    def __init__(self, host, port=25, username=None, password=None, sender=None, starttls=False):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username or f"clinic@{host}"
+        self.starttls = starttls
+
+    def _connect(self):
+        import smtplib
+
+        connection = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.starttls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password or "")
+        return connection
+
+    def send_many(self, messages, batch_size=DEFAULT_BATCH_SIZE, max_workers=8):
+        import smtplib
+
+        results = []
+        for start in range(0, len(messages), batch_size):
+            chunk = messages[start:start + batch_size]
+            try:
+                with span("smtp.batch", size=len(chunk)):
+                    connection = self._connect()
+                    try:
+                        for to, subject, body in chunk:
+                            results.append(self._deliver(connection, build_message(to, subject, body, self.sender)))
+                    finally:
+                        try:
+                            connection.quit()
+                        except smtplib.SMTPException:
+                            pass
+            except (smtplib.SMTPException, OSError) as error:
+                # The connection failed: every message of the batch not yet handed over failed with it
+                status = getattr(error, "smtp_code", 421)
+                results.extend((None, BackendError(status, f"SMTP delivery failed: {error}")) for _ in chunk[len(results) - start:])
+        return results
+
+    @staticmethod
+    def _deliver(connection, message):
+        import smtplib
+
+        try:
+            refused = connection.send_message(message)
+        except smtplib.SMTPRecipientsRefused as error:
+            refused = error.recipients
+        except smtplib.SMTPResponseException as error:
+            return None, BackendError(error.smtp_code, f"SMTP delivery failed: {error.smtp_error!r}")
+        if refused:
+            code, reply = next(iter(refused.values()))
+            return None, BackendError(code, f"SMTP server refused {message['To']}: {reply!r}")
+        return message["Message-ID"], None
+
+
+class SpoolBackend(EmailBackend):
+    """A local Maildir: messages are written to disk for a mail client or relay to pick up. Thread-safe."""
+
+    name = "spool"
+
+    def __init__(self, directory, sender="clinic@localhost"):
+        import mailbox
+
+        self.directory = directory
+        self.sender = sender
+        self._maildir = mailbox.Maildir(directory, create=True)
+        self._lock = threading.Lock()
+
+    def send_many(self, messages, batch_size=DEFAULT_BATCH_SIZE, max_workers=8):
+        results = []
+        for start in range(0, len(messages), batch_size):
+            chunk = messages[start:start + batch_size]
+            with span("email_spool.batch", size=len(chunk)), self._lock:
+                for to, subject, body in chunk:
+                    try:
+                        results.append((self._maildir.add(build_message(to, subject, body, self.sender)), None))
+                    except OSError as error:
+                        results.append((None, BackendError(507, f"Cannot write to the email spool: {error}")))
+        return results
+
+
+def _backend_name(variable, choices):
+    name = os.getenv(variable, choices[0]).strip().lower()
+    if name not in choices:
+        raise ValueError(f"Unknown {variable} {name!r}; use one of {', '.join(choices)}")
+    return name
+
+
+_local_backends = {}
+_local_backends_lock = threading.Lock()
+
+
+def _local_backend(name, build):
+    # Local backends hold a database or spool handle, so every tool shares one per process
+    with _local_backends_lock:
+        backend = _local_backends.get(name)
+        if backend is None:
+            backend = _local_backends[name] = build()
+        return backend
+
+
+def calendar_backend_name():
+    """Return the calendar backend CALENDAR_BACKEND names; raises ValueError for an unknown one."""
+    return _backend_name("CALENDAR_BACKEND", CALENDAR_BACKENDS)
+
+
+def calendar_backend(google_service):
+    """Return the backend named by CALENDAR_BACKEND; `google_service()` builds this thread's Calendar service."""
+    if calendar_backend_name() == "sqlite":
+        from sqlite_calendar import SQLiteCalendar
+
+        return _local_backend("sqlite", lambda: SQLiteCalendar(os.getenv("CALENDAR_DB_PATH", DEFAULT_CALENDAR_DB_PATH)))
+    return GoogleCalendarBackend(google_service())
+
+
+def email_backend(gmail_service):
+    """Return the backend named by EMAIL_BACKEND; `gmail_service()` builds this thread's Gmail service."""
+    name = _backend_name("EMAIL_BACKEND", EMAIL_BACKENDS)
+    if name == "smtp":
+        return _local_backend("smtp", lambda: SMTPBackend(
+            os.getenv("SMTP_HOST", "localhost"),
+            int(os.getenv("SMTP_PORT", 25)),
+            os.getenv("SMTP_USERNAME"),
+            os.getenv("SMTP_PASSWORD"),
+            os.getenv("SMTP_FROM"),
+            os.getenv("SMTP_STARTTLS", "").strip().lower() in ("1", "true", "yes"),
+        ))
+    if name == "spool":
+        return _local_backend("spool", lambda: SpoolBackend(
+            os.getenv("EMAIL_SPOOL_DIR", DEFAULT_EMAIL_SPOOL_DIR),
+            os.getenv("SMTP_FROM", "clinic@localhost"),
+        ))
+    return GmailBackend(gmail_service())
+
@@ -0,0 +1,170 @@
+"""In-process stand-ins for the Calendar, Gmail and Gemini APIs used by the benchmarks.
+
+Each fake sleeps for a configurable latency per round trip and fails a configurable
+fraction of calls, so throughput can be measured without touching Google:
+
+    backends = install(latency=0.05, error_rate=0.01)
+    ...
+    backends.calendar.calls  # API calls served so far
+"""
+import itertools
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeBackend:
+    """Latency and error injection shared by every call to one fake API."""
+
+    def __init__(self, name, latency=0.0, error_rate=0.0, seed=0):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def respond(self):
+        """Return a response body for one call, or raise the HttpError Google would."""
+        from googleapiclient.errors import HttpError
+        import httplib2
+
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            call_id = next(self._ids)
+        if failed:
+            raise HttpError(httplib2.Response({"status": 503}), b"Injected backend error")
+        return {"id": f"{self.name}{call_id}"}
+
+
+class FakeApiRequest:
+    def __init__(self, backend, body=None):
+        self.backend = backend
+        # Calendar keeps the event id the client chose, if any
+        self.resource_id = (body or {}).get("id")
+
+    def respond(self):
+        response = self.backend.respond()
+        if self.resource_id is not None:
+            response["id"] = self.resource_id
+        return response
+
+    def execute(self):
+        self.backend.round_trip()
+        return self.respond()
+
+
+class FakeListRequest:
+    """An events().list page: the fake calendar starts empty, so there is nothing to mirror."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def execute(self):
+        self.backend.round_trip()
+        return {"items": [], "nextSyncToken": "fake-sync-token"}
+
+
+class FakeBatchRequest:
+    """Mimics BatchHttpRequest: one round trip for the whole batch, one callback per call."""
+
+    def __init__(self, backend, callback):
+        self.backend = backend
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        from googleapiclient.errors import HttpError
+
+        self.backend.round_trip()
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request.respond(), None)
+            except HttpError as error:
+                self.callback(request_id, None, error)
+
+
+class FakeService:
+    """Answers service.events().insert/list(...) and service.users().messages().send(...)."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def events(self):
+        return self
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def insert(self, calendarId, body):
+        return FakeApiRequest(self.backend, body)
+
+    def list(self, calendarId, **params):
+        return FakeListRequest(self.backend)
+
+    def send(self, userId, body):
+        return FakeApiRequest(self.backend)
+
+    def new_batch_http_request(self, callback):
+        return FakeBatchRequest(self.backend, callback)
+
+
+class FakeClientManager:
+    """Drop-in for GoogleClientManager that hands out fake services."""
+
+    def __init__(self, services):
+        self.services = services
+
+    def service(self, name, version):
+        return self.services[name]
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel that answers with canned text."""
+
+    def __init__(self, backend, chunks=5):
+        self.backend = backend
+        self.chunks = chunks
+
+    def generate_content(self, prompt, stream=False):
+        self.backend.round_trip()
+        self.backend.respond()
+        parts = [SimpleNamespace(text=f"Answer part {index} for: {prompt}. ") for index in range(self.chunks)]
+        if stream:
+            return iter(parts)
+        return SimpleNamespace(text="".join(part.text for part in parts))
+
+
+def install(latency=0.0, error_rate=0.0, seed=0):
+    """Point the scheduling tools and the chatbot at fake backends; returns the backends."""
+    import chatbot
+    import chatbot_tools
+    import EmailTool
+    import ScheduleTool
+
+    backends = SimpleNamespace(
+        calendar=FakeBackend("event", latency, error_rate, seed),
+        gmail=FakeBackend("message", latency, error_rate, seed + 1),
+        gemini=FakeBackend("answer", latency, error_rate, seed + 2),
+    )
+    manager = FakeClientManager({"calendar": FakeService(backends.calendar), "gmail": FakeService(backends.gmail)})
+    for module in (ScheduleTool, EmailTool, chatbot_tools):
+        module.get_client_manager = lambda *args, **kwargs: manager
+    chatbot._gemini_model = FakeGenerativeModel(backends.gemini)
+    return backends
@@ -0,0 +1,93 @@
+"""Startup benchmark: import cost per module and chatbot time-to-first-window.
+
+Run from the repository root:
+
+    python -m benchmarks.startup [--repeat 5]
+
+Every measurement runs in a fresh interpreter so earlier imports do not hide later ones.
+The time-to-first-window measurement needs a display.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "chatbot",
+    "chatbot_tools",
+    "medical_scheduler",
+    "ScheduleTool",
+    "EmailTool",
+    "google_clients",
+    "portia",
+    "google.generativeai",
+    "googleapiclient.discovery",
+]
+
+FIRST_WINDOW_SCRIPT = """
+import os, time
+start = time.perf_counter()
+import tkinter as tk
+import chatbot
+root = tk.Tk()
+app = chatbot.ChatbotUI(root)
+root.update()
+print(time.perf_counter() - start, flush=True)
+os._exit(0)
+"""
+
+
+def run_python(args):
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, cwd=ROOT)
+
+
+def import_cost(module):
+    """Return the cumulative import time of `module` in seconds, from `python -X importtime`."""
+    proc = run_python(["-X", "importtime", "-c", f"import {module}"])
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    for line in reversed(proc.stderr.splitlines()):
+        fields = [field.strip() for field in line.removeprefix("import time:").split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+    raise RuntimeError(f"{module} not found in importtime output")
+
+
+def time_to_first_window():
+    proc = run_python(["-c", FIRST_WINDOW_SCRIPT])
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return float(proc.stdout.split()[-1])
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        samples.append(func())
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement; the median is reported")
+    args = parser.parse_args()
+
+    print(f"{'module':<28}{'import (ms)':>12}")
+    for module in MODULES:
+        try:
+            print(f"{module:<28}{measure(lambda: import_cost(module), args.repeat) * 1000:>12.1f}")
+        except RuntimeError as e:
+            print(f"{module:<28}{'failed':>12}  {e}")
+
+    try:
+        print(f"\ntime to first window: {measure(time_to_first_window, args.repeat) * 1000:.1f} ms")
+    except RuntimeError as e:
+        print(f"\ntime to first window: failed  {e}")
+
+
+if __name__ == "__main__":
+    main()
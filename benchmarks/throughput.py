@@ -0,0 +1,261 @@
+"""Throughput benchmark: scheduling and email stages against fake Google and Gemini backends.
+
+Run from the repository root:
+
+    python -m benchmarks.throughput [--sizes 10,1000,100000] [--latency 0.05] [--error-rate 0.01] [--backend local]
+
+Every stage processes synthetic request loads and reports requests/sec, p50/p99
+latency per call and peak traced memory:
+
+* schedule_tool  - ScheduleTool.run, one request per call
+* email_tool     - EmailTool.run, one request per call
+* process        - medical_scheduler.process_appointments, one batch per call
+* chatbot        - ChatbotUI.process_user_input("schedule ..."), one batch per call (needs a display)
+* chat_fallback  - ChatbotUI.process_user_input for a general question answered by Gemini
+
+With --backend local, bookings go to the SQLite calendar and emails to a Maildir spool
+(see backends.py) in a temporary folder instead of the fake Google APIs.
+
+Peak memory comes from tracemalloc, which also slows the stage down; compare timings
+between runs of this benchmark, not against production.
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks import fakes
+from calendar_shards import get_calendar_shards
+from google_batch import DEFAULT_BATCH_SIZE
+from outbox import configure_outbox
+from slot_allocator import PROVIDERS, SEARCH_HORIZON_DAYS, SlotAllocator
+
+# chatbot and medical_scheduler refuse to import without a key; the fakes never use it
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+# Measure the code, not the per-calendar rate budget
+os.environ.setdefault("CALENDAR_RATE_LIMIT", "1000000")
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000, 1000000]
+STAGES = ["schedule_tool", "email_tool", "process", "chatbot", "chat_fallback"]
+
+CONDITIONS = ["chest pain", "annual checkup", "diabetes follow-up", "migraine", "fever", "back pain"]
+URGENCIES = ["urgent", "moderate", "routine"]
+
+
+def synthetic_requests(count, seed=0):
+    """Yield `count` patient requests with random conditions and urgencies."""
+    rng = random.Random(seed)
+    start = datetime(2025, 4, 12, 8, 0)
+    for index in range(count):
+        yield {
+            "patient": f"Patient {index}",
+            "condition": rng.choice(CONDITIONS),
+            "urgency": rng.choice(URGENCIES),
+            "email": f"patient{index}@example.com",
+            "timestamp": (start + timedelta(seconds=index)).isoformat(),
+        }
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def reset_slots(count):
+    """Give every calendar's allocator enough providers to book `count` requests within the search horizon."""
+    capacity = SlotAllocator().slots_per_day * (SEARCH_HORIZON_DAYS - 3)
+    providers = max(PROVIDERS, -(-count // capacity))
+    for shard in get_calendar_shards().shards:
+        shard.allocator = SlotAllocator(providers=providers)
+        shard.mirror.allocator = shard.allocator
+
+
+def tool_context():
+    from portia import ToolRunContext
+    import medical_scheduler
+
+    return ToolRunContext(
+        execution_context={"user": "benchmark", "session": "default"},
+        plan_run_id=f"prun-{uuid.uuid4()}",
+        config=medical_scheduler.get_runtime().google_config,
+        clarifications=[]
+    )
+
+
+def schedule_tool_calls(count):
+    """Yield one callable per request; the schedule_tool stage times each of them."""
+    import medical_scheduler
+
+    schedule_tool = medical_scheduler.get_runtime().schedule_tool
+    context = tool_context()
+    date = datetime.now().strftime("%Y-%m-%d")
+    for _ in range(count):
+        yield 1, lambda: schedule_tool.run(context, date)
+
+
+def email_tool_calls(count):
+    import medical_scheduler
+
+    email_tool = medical_scheduler.get_runtime().email_tool
+    context = tool_context()
+    for req in synthetic_requests(count):
+        yield 1, lambda email=req["email"]: email_tool.run(context, email)
+
+
+def process_calls(count):
+    import medical_scheduler
+
+    for chunk in chunked(synthetic_requests(count), DEFAULT_BATCH_SIZE):
+        yield len(chunk), lambda chunk=chunk: medical_scheduler.process_appointments(chunk)
+
+
+@contextlib.contextmanager
+def chatbot_ui():
+    """A ChatbotUI in a hidden window, working on a throwaway request queue and log."""
+    import tkinter as tk
+    import chatbot
+    from request_queue import RequestQueue
+    from request_store import RequestStore
+    from response_cache import ResponseCache
+
+    saved = chatbot.request_queue, chatbot.request_store, chatbot.response_cache
+    with tempfile.TemporaryDirectory() as directory:
+        chatbot.request_queue = RequestQueue()
+        chatbot.request_store = RequestStore(os.path.join(directory, "requests.jsonl"), fsync=False)
+        chatbot.response_cache = ResponseCache()
+        root = tk.Tk()
+        root.withdraw()
+        ui = chatbot.ChatbotUI(root)
+        try:
+            yield ui
+        finally:
+            ui.on_close()
+            chatbot.request_queue, chatbot.request_store, chatbot.response_cache = saved
+
+
+def discard_ui_updates(ui):
+    # The Tk side is not measured here; drop queued UI work so it does not pile up
+    while not ui.ui_queue.empty():
+        ui.ui_queue.get_nowait()
+
+
+def chatbot_calls(count, ui):
+    import chatbot
+
+    for chunk in chunked(synthetic_requests(count), DEFAULT_BATCH_SIZE):
+        def call(chunk=chunk):
+            for req in chunk:
+                chatbot.request_queue.push(req)
+            ui.process_user_input("schedule appointments")
+            discard_ui_updates(ui)
+        yield len(chunk), call
+
+
+def chat_fallback_calls(count, ui):
+    for index in range(count):
+        def call(index=index):
+            ui.process_user_input(f"What should patient {index} bring to the appointment?")
+            discard_ui_updates(ui)
+        yield 1, call
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_stage(calls):
+    """Time every call from `calls`, returning requests/sec, p50 and p99 latency and peak memory."""
+    latencies = []
+    handled = 0
+    tracemalloc.start()
+    started = time.perf_counter()
+    # process_appointments prints a line per failed request
+    with contextlib.redirect_stdout(io.StringIO()):
+        for size, call in calls:
+            call_started = time.perf_counter()
+            try:
+                call()
+            except Exception:
+                # Tool errors are part of the load; they are counted by the fake backends
+                pass
+            latencies.append(time.perf_counter() - call_started)
+            handled += size
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "rate": handled / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50) if latencies else 0.0,
+        "p99": percentile(latencies, 0.99) if latencies else 0.0,
+        "peak": peak,
+    }
+
+
+def stage_calls(stage, count, stack):
+    if stage in ("chatbot", "chat_fallback"):
+        ui = stack.enter_context(chatbot_ui())
+        return (chatbot_calls if stage == "chatbot" else chat_fallback_calls)(count, ui)
+    return {"schedule_tool": schedule_tool_calls, "email_tool": email_tool_calls, "process": process_calls}[stage](count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma-separated request counts")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages to run")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per fake API round trip")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake API calls that fail")
+    parser.add_argument("--backend", choices=("fake", "local"), default="fake", help="fake Google APIs or the local SQLite calendar and email spool")
+    args = parser.parse_args()
+
+    # Per-request log lines, including the injected errors, would dominate the timings
+    logging.disable(logging.ERROR)
+    # Checkpoints, and with --backend local the calendar and spool, go to a throwaway folder
+    scratch = tempfile.TemporaryDirectory()
+    configure_outbox(os.path.join(scratch.name, "outbox.sqlite3"))
+    # Keep the benchmark's bookings and chat out of the real calendar mirrors and session history.
+    # Set before fakes.install(), which imports chatbot, and chatbot reads them at import
+    os.environ["CALENDAR_MIRROR_DIR"] = os.path.join(scratch.name, "calendar_mirror")
+    os.environ["SESSION_HISTORY_PATH"] = os.path.join(scratch.name, "session_history.jsonl")
+    if args.backend == "local":
+        os.environ.update(
+            CALENDAR_BACKEND="sqlite",
+            CALENDAR_DB_PATH=os.path.join(scratch.name, "calendar.sqlite3"),
+            EMAIL_BACKEND="spool",
+            EMAIL_SPOOL_DIR=os.path.join(scratch.name, "email_spool"),
+        )
+    backends = fakes.install(args.latency, args.error_rate)
+    print(f"{'stage':<15}{'requests':>10}{'req/s':>12}{'p50 (ms)':>11}{'p99 (ms)':>11}{'peak (MB)':>11}{'errors':>9}")
+    for stage in args.stages.split(","):
+        for count in map(int, args.sizes.split(",")):
+            reset_slots(count)
+            errors_before = sum(backend.errors for backend in vars(backends).values())
+            try:
+                with contextlib.ExitStack() as stack:
+                    result = run_stage(stage_calls(stage, count, stack))
+            except Exception as e:
+                print(f"{stage:<15}{count:>10}  failed  {e}")
+                continue
+            errors = sum(backend.errors for backend in vars(backends).values()) - errors_before
+            print(
+                f"{stage:<15}{count:>10}{result['rate']:>12.1f}{result['p50'] * 1000:>11.2f}"
+                f"{result['p99'] * 1000:>11.2f}{result['peak'] / 2**20:>11.1f}{errors:>9}",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
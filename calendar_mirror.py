@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+from backends import BackendError
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MIRROR_DIR = os.path.join(BASE_DIR, "calendar_mirror")
+
+# A full sync fetches events from this far back; incremental syncs then follow every change
+FULL_SYNC_LOOKBACK = timedelta(days=1)
+
+
+def _utc(moment):
+    """Parse an RFC 3339 date-time into a naive UTC datetime, the form the slot allocator uses."""
+    parsed = datetime.fromisoformat(moment)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def event_record(event):
+    """Reduce a Calendar event resource to what the mirror keeps, or None for all-day events."""
+    start, end = event.get("start", {}), event.get("end", {})
+    if "dateTime" not in start or "dateTime" not in end:
+        # All-day entries (holidays, notes) do not occupy appointment slots
+        return None
+    return {
+        "id": event["id"],
+        "summary": event.get("summary", ""),
+        "description": event.get("description", ""),
+        "start": _utc(start["dateTime"]).isoformat(),
+        "end": _utc(end["dateTime"]).isoformat(),
+    }
+
+
+class CalendarMirror:
+    """Local copy of one calendar's events, kept current with incremental sync (see CalendarBackend.list_changes).
+
+    The first sync lists events from FULL_SYNC_LOOKBACK ago onwards and stores the
+    nextSyncToken; later syncs send the token and receive only what changed since,
+    including cancellations. Events and token are saved to a JSON file, so a restart
+    loads the calendar from disk and resumes incrementally. Every mirrored event
+    holds its slots in `allocator`, so availability and conflict checks need no API
+    call. Thread-safe.
+    """
+
+    def __init__(self, calendar_id, allocator, path=None):
+        self.calendar_id = calendar_id
+        self.allocator = allocator
+        safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", calendar_id)
+        self.path = path or os.path.join(os.getenv("CALENDAR_MIRROR_DIR", MIRROR_DIR), f"{safe_name}.json")
+        self.sync_token = None
+        self._events = {}
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    def load(self):
+        """Read the saved mirror on first call and return its events; later calls return []."""
+        with self._lock:
+            if self._loaded:
+                return []
+            self._loaded = True
+            if not os.path.exists(self.path):
+                return []
+            try:
+                with open(self.path) as mirror_file:
+                    saved = json.load(mirror_file)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable calendar mirror {self.path}: {str(e)}")
+                return []
+            self.sync_token = saved.get("sync_token")
+            for record in saved.get("events", []):
+                self._put(record)
+            logger.info(f"Loaded {len(self._events)} events of {self.calendar_id} from {self.path}")
+            return list(self._events.values())
+
+    def _put(self, record):
+        """Store a record, moving its slot reservation if its times changed; returns whether anything changed."""
+        previous = self._events.get(record["id"])
+        self._events[record["id"]] = record
+        if previous is None or (previous["start"], previous["end"]) != (record["start"], record["end"]):
+            if previous is not None:
+                self.allocator.release_span(_utc(previous["start"]), _utc(previous["end"]))
+            self.allocator.reserve_span(_utc(record["start"]), _utc(record["end"]))
+        return previous != record
+
+    def _drop(self, event_id):
+        previous = self._events.pop(event_id, None)
+        if previous is not None:
+            self.allocator.release_span(_utc(previous["start"]), _utc(previous["end"]))
+        return previous
+
+    def record(self, event_id, start, end, summary="", description=""):
+        """Add an event this process just created; its slot is already allocated, so none is reserved."""
+        with self._lock:
+            self._events[event_id] = {
+                "id": event_id,
+                "summary": summary,
+                "description": description,
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+            }
+            self._dirty = True
+
+    def sync(self, backend):
+        """Fetch changes since the last sync from a calendar backend and apply them.
+
+        Returns the changed events; cancelled ones come back with "cancelled": True.
+        An expired sync token (410 Gone) triggers a fresh full sync.
+        """
+        self.load()
+        with self._lock:
+            sync_token = self.sync_token
+            known_before = set(self._events)
+        # Bookings may record new events while the listing is in flight
+        try:
+            items, next_token = self._list_changes(backend, sync_token)
+            full_sync = sync_token is None
+        except BackendError as error:
+            if sync_token is None or error.status != 410:
+                raise
+            logger.info(f"Sync token for {self.calendar_id} expired, running a full sync")
+            items, next_token = self._list_changes(backend, None)
+            full_sync = True
+
+        with self._lock:
+            changes = []
+            seen = set()
+            for item in items:
+                seen.add(item["id"])
+                if item.get("status") == "cancelled":
+                    dropped = self._drop(item["id"])
+                    if dropped is not None:
+                        changes.append(dict(dropped, cancelled=True))
+                    continue
+                record = event_record(item)
+                if record is None:
+                    continue
+                if self._put(record):
+                    changes.append(record)
+            if full_sync:
+                # A full listing is the whole truth: anything known before it and not mentioned is gone
+                for event_id in [event_id for event_id in known_before if event_id not in seen and event_id in self._events]:
+                    changes.append(dict(self._drop(event_id), cancelled=True))
+            self._prune()
+            self.sync_token = next_token
+            self._dirty = True
+            self.save()
+            logger.info(f"Synced {self.calendar_id}: {len(changes)} changes, {len(self._events)} events mirrored")
+            return changes
+
+    def _prune(self):
+        # Events that ended before the full sync window are history; forgetting them keeps the mirror flat
+        cutoff = (datetime.now(timezone.utc).replace(tzinfo=None) - FULL_SYNC_LOOKBACK).isoformat()
+        for event_id in [event_id for event_id, event in self._events.items() if event["end"] < cutoff]:
+            self._drop(event_id)
+
+    def _list_changes(self, backend, sync_token):
+        if sync_token:
+            return backend.list_changes(self.calendar_id, sync_token)
+        return backend.list_changes(self.calendar_id, time_min=datetime.now(timezone.utc) - FULL_SYNC_LOOKBACK)
+
+    def save(self):
+        """Write events and sync token to disk atomically if anything changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            saved = {"calendar_id": self.calendar_id, "sync_token": self.sync_token, "events": list(self._events.values())}
+            self._dirty = False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".mirror-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as mirror_file:
+                json.dump(saved, mirror_file)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def __len__(self):
+        return len(self._events)
@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from calendar_mirror import CalendarMirror
+from slot_allocator import PROVIDERS, SlotAllocator
+
+logger = logging.getLogger(__name__)
+
+# Defaults when CALENDAR_IDS / CALENDAR_SHARD_KEY / CALENDAR_RATE_LIMIT are not set
+DEFAULT_CALENDAR_IDS = "primary"
+DEFAULT_SHARD_KEY = "patient"
+# Calendar API writes per second allowed on each calendar
+DEFAULT_RATE_LIMIT = 10.0
+
+
+class RateLimiter:
+    """Token bucket: `rate` tokens per second, holding at most `burst`. Thread-safe."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until the budget allows `tokens` more calls.
+
+        A batch larger than the burst goes through once the bucket is full and leaves
+        it in debt, so later callers wait and the average rate still holds.
+        """
+        needed = min(tokens, self.burst)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CalendarShard:
+    """One calendar with its own slot allocator, local mirror, single booking worker and rate budget."""
+
+    def __init__(self, calendar_id, rate=DEFAULT_RATE_LIMIT, providers=PROVIDERS):
+        self.calendar_id = calendar_id
+        self.allocator = SlotAllocator(providers=providers)
+        # Events already on the calendar hold their slots in the allocator
+        self.mirror = CalendarMirror(calendar_id, self.allocator)
+        self.rate_limiter = RateLimiter(rate)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"calendar-{calendar_id}")
+        self._synced = False
+        self._sync_lock = threading.Lock()
+
+    def submit(self, func, *args):
+        return self.executor.submit(func, self, *args)
+
+    def sync_once(self, backend):
+        """Sync the mirror on the first call, so events booked by earlier runs or by hand hold their slots.
+
+        Callers that keep the mirror current themselves, like the chatbot, need not call this.
+        """
+        with self._sync_lock:
+            if not self._synced:
+                self.mirror.sync(backend)
+                self._synced = True
+
+
+class CalendarShards:
+    """Routes booking requests to calendars by hashing a shard key, e.g. the patient or condition.
+
+    The hash is stable across runs, so the same key always lands on the same calendar
+    as long as the list of calendars does not change.
+    """
+
+    def __init__(self, calendar_ids, key=DEFAULT_SHARD_KEY, rate=DEFAULT_RATE_LIMIT, providers=PROVIDERS):
+        if not calendar_ids:
+            raise ValueError("At least one calendar id is required")
+        self.key = key
+        self.shards = [CalendarShard(calendar_id, rate, providers) for calendar_id in calendar_ids]
+
+    def route(self, item):
+        value = str(item.get(self.key, "")).casefold()
+        return self.shards[zlib.crc32(value.encode()) % len(self.shards)]
+
+    def group(self, items):
+        """Split items by shard, returning {shard: [(index, item), ...]} with indexes into `items`."""
+        groups = {}
+        for index, item in enumerate(items):
+            groups.setdefault(self.route(item), []).append((index, item))
+        return groups
+
+
+_shards = None
+_shards_lock = threading.Lock()
+
+
+def _shards_from_env(providers=PROVIDERS):
+    calendar_ids = [c.strip() for c in os.getenv("CALENDAR_IDS", DEFAULT_CALENDAR_IDS).split(",") if c.strip()]
+    key = os.getenv("CALENDAR_SHARD_KEY", DEFAULT_SHARD_KEY)
+    rate = float(os.getenv("CALENDAR_RATE_LIMIT", DEFAULT_RATE_LIMIT))
+    logger.info(f"Booking on {len(calendar_ids)} calendar(s), sharded by {key}")
+    return CalendarShards(calendar_ids, key, rate, providers)
+
+
+def get_calendar_shards():
+    """Return the process-wide shards configured from CALENDAR_IDS, CALENDAR_SHARD_KEY and CALENDAR_RATE_LIMIT."""
+    global _shards
+    with _shards_lock:
+        if _shards is None:
+            _shards = _shards_from_env()
+        return _shards
+
+
+def configure_calendar_shards(providers=PROVIDERS):
+    """Replace the process-wide shards, e.g. to give a worker process a share of each calendar's providers."""
+    global _shards
+    with _shards_lock:
+        _shards = _shards_from_env(providers)
+        return _shards
@@ -0,0 +1,455 @@
+import os
+import csv
+import json
+import logging
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field, ValidationError
+from portia import Tool, ToolRunContext
+from portia.errors import ToolHardError, ToolSoftError
+from backends import BackendError, calendar_backend, email_backend
+from google_clients import get_client_manager
+from calendar_shards import get_calendar_shards
+from google_batch import DEFAULT_BATCH_SIZE
+from metrics import traced
+from outbox import DONE, STARTED, event_id, get_outbox, schedule_key
+from patient_requests import request_queue, request_store
+from request_queue import URGENCY_SCORES
+from triage import triage_mode, triage_requests
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CREDENTIALS_PATH = os.path.join(BASE_DIR, "credentials.json")
+TOKEN_PATH = os.path.join(BASE_DIR, "token.json")
+SCOPES = ["https://www.googleapis.com/auth/calendar", "https://www.googleapis.com/auth/gmail.send"]
+
+# Import reports list at most this many rejected rows; the rest are only counted
+MAX_REPORTED_REJECTS = 20
+
+class ScheduleToolSchema(BaseModel):
+    date: str = Field(..., description="The date to set the schedule (format: YYYY-MM-DD)")
+    patient: str = Field(..., description="Patient name")
+    condition: str = Field(..., description="Reason for appointment")
+    request_id: str | None = Field(None, description="Id of the patient request being booked; makes retries idempotent")
+
+class ScheduleTool(Tool[str]):
+    id: str = "schedule_tool"
+    name: str = "Scheduler"
+    description: str = "Schedule appointments on the clinic calendar"
+    args_schema: type[BaseModel] = ScheduleToolSchema
+    output_schema: tuple[str, str] = ("str", "String output of the scheduled appointment")
+
+    def _get_calendar_service(self):
+        try:
+            return get_client_manager(TOKEN_PATH, CREDENTIALS_PATH, SCOPES).service("calendar", "v3")
+        except Exception as e:
+            logger.error(f"Authentication failed: {str(e)}")
+            raise ToolHardError(f"Failed to authenticate with Google Calendar: {str(e)}")
+
+    def _get_backend(self):
+        """Return the calendar backend chosen by CALENDAR_BACKEND (Google Calendar by default)."""
+        try:
+            return calendar_backend(self._get_calendar_service)
+        except ValueError as e:
+            raise ToolHardError(str(e))
+
+    @staticmethod
+    def _parse_date(date: str) -> datetime:
+        try:
+            event_date = datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            logger.error(f"Invalid date format: {date}")
+            raise ToolSoftError(f"Invalid date format: {date}. Use YYYY-MM-DD")
+        # Never book in the past: for today, start searching from the current time (UTC)
+        return max(event_date, datetime.now(timezone.utc).replace(tzinfo=None))
+
+    @staticmethod
+    def _build_event(start: datetime, end: datetime, patient: str, condition: str, event_id: str | None = None) -> dict:
+        event = {
+            "summary": f"Appointment for {patient}",
+            "description": f"Condition: {condition}",
+            "start": {
+                "dateTime": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "timeZone": "UTC",
+            },
+            "end": {
+                "dateTime": end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "timeZone": "UTC",
+            },
+        }
+        if event_id is not None:
+            event["id"] = event_id
+        return event
+
+    @staticmethod
+    def _allocate(shard, earliest: datetime) -> tuple[datetime, datetime]:
+        try:
+            return shard.allocator.allocate(earliest)
+        except ValueError as e:
+            raise ToolSoftError(str(e))
+
+    @traced("schedule_tool.run")
+    def run(self, _: ToolRunContext, date: str, patient: str, condition: str, request_id: str | None = None) -> str:
+        if request_id is not None:
+            # Bookings tied to a request go through the outbox so a retry never books twice
+            outcome = self.run_batch(_, [{"date": date, "patient": patient, "condition": condition, "request_id": request_id}])[0]
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        start = None
+        shard = get_calendar_shards().route({"date": date, "patient": patient, "condition": condition})
+        try:
+            earliest = self._parse_date(date)
+
+            backend = self._get_backend()
+
+            start, end = self._allocate(shard, earliest)
+            event = self._build_event(start, end, patient, condition)
+            logger.info(f"Creating calendar event for {patient} on {date} in {shard.calendar_id}: {event}")
+            if backend.rate_limited:
+                shard.rate_limiter.acquire()
+            created_event = backend.insert(shard.calendar_id, event)
+            shard.mirror.record(created_event["id"], start, end, event["summary"], event["description"])
+
+            return f"Scheduled appointment for {patient} on {start:%Y-%m-%d} at {start:%H:%M} UTC. Event ID: {created_event['id']}"
+
+        except ToolSoftError:
+            raise
+        except BackendError as error:
+            logger.error(f"Calendar {backend.name} error: {error}")
+            if start is not None:
+                shard.allocator.release(start)
+            raise ToolSoftError(f"Failed to schedule event: {error}")
+        except Exception as e:
+            logger.error(f"Unexpected error in ScheduleTool: {str(e)}")
+            if start is not None:
+                shard.allocator.release(start)
+            raise ToolHardError(f"An unexpected error occurred: {str(e)}")
+
+    @traced("schedule_tool.run_batch")
+    def run_batch(self, _: ToolRunContext, items: list[dict], batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+        """Book many appointments through batched Calendar inserts.
+
+        Each item holds the run() arguments (date, patient, condition and optionally
+        request_id). Items are routed to their calendar shard and every shard books its
+        share on its own worker, so several calendars book in parallel. Items with a
+        request_id are checkpointed in the outbox: one already booked is answered from
+        it, and one that may have been inserted is retried under the same event id.
+        Returns a result string or a ToolSoftError/ToolHardError per item, in order.
+        """
+        outcomes = [None] * len(items)
+        futures = [
+            shard.submit(self._book_on_shard, group, batch_size)
+            for shard, group in get_calendar_shards().group(items).items()
+        ]
+        for future in futures:
+            for index, outcome in future.result():
+                outcomes[index] = outcome
+        return outcomes
+
+    def _book_on_shard(self, shard, group: list[tuple[int, dict]], batch_size: int) -> list:
+        """Book (index, item) pairs on one calendar within its rate budget; returns (index, outcome) pairs."""
+        outbox = get_outbox()
+        keys = {index: schedule_key(item["request_id"]) for index, item in group if item.get("request_id")}
+        checkpoints = outbox.get_many(keys.values())
+        outcomes = []
+        valid = []
+        for index, item in group:
+            status, data = checkpoints.get(keys.get(index), (None, None))
+            if status == DONE:
+                # Booked by an earlier run; keep its slot taken in this process too
+                shard.allocator.reserve(datetime.fromisoformat(data["start"]))
+                outcomes.append((index, data["result"]))
+                continue
+            try:
+                valid.append((index, item, self._parse_date(item["date"])))
+            except ToolSoftError as error:
+                outcomes.append((index, error))
+        if not valid:
+            return outcomes
+
+        try:
+            backend = self._get_backend()
+        except ToolHardError as error:
+            return outcomes + [(index, error) for index, _, _ in valid]
+        pending = []
+        for index, item, earliest in valid:
+            key = keys.get(index)
+            status, data = checkpoints.get(key, (None, None))
+            # Checkpoints written before calendars were sharded name no calendar: those went to "primary"
+            if status == STARTED and data.get("calendar", "primary") == shard.calendar_id:
+                # The insert may have landed before the last run stopped: retry the same slot and event id
+                start = datetime.fromisoformat(data["start"])
+                end = start + shard.allocator.slot_length
+                shard.allocator.reserve(start)
+            else:
+                try:
+                    start, end = self._allocate(shard, earliest)
+                except ToolSoftError as error:
+                    outcomes.append((index, error))
+                    continue
+            event = self._build_event(start, end, item["patient"], item["condition"], event_id(shard.calendar_id, key) if key else None)
+            pending.append((index, item, key, start, event))
+
+        logger.info(f"Creating {len(pending)} calendar events in {shard.calendar_id} in batches of {batch_size}")
+        for chunk_start in range(0, len(pending), batch_size):
+            chunk = pending[chunk_start:chunk_start + batch_size]
+            outbox.mark_many(STARTED, [
+                (key, {"calendar": shard.calendar_id, "start": start.isoformat(), "event_id": event.get("id")})
+                for _, _, key, start, event in chunk
+            ])
+            if backend.rate_limited:
+                shard.rate_limiter.acquire(len(chunk))
+            booked = []
+            forget = []
+            results = backend.insert_many(shard.calendar_id, [event for *_, event in chunk], batch_size)
+            for (index, item, key, start, event), (created_event, error) in zip(chunk, results):
+                if error is None or key is not None and isinstance(error, BackendError) and error.status == 409:
+                    # A 409 for our own event id means an earlier attempt already created it
+                    booked_id = created_event["id"] if error is None else event["id"]
+                    result = f"Scheduled appointment for {item['patient']} on {start:%Y-%m-%d} at {start:%H:%M} UTC. Event ID: {booked_id}"
+                    shard.mirror.record(booked_id, start, start + shard.allocator.slot_length, event["summary"], event["description"])
+                    booked.append((key, {"calendar": shard.calendar_id, "start": start.isoformat(), "result": result}))
+                    outcomes.append((index, result))
+                    continue
+                shard.allocator.release(start)
+                if isinstance(error, BackendError):
+                    if error.status < 500:
+                        # Calendar rejected the insert, so nothing was created and the next run starts afresh
+                        forget.append(key)
+                    logger.error(f"Calendar {backend.name} error for {item['patient']}: {error}")
+                    outcomes.append((index, ToolSoftError(f"Failed to schedule event: {error}")))
+                else:
+                    logger.error(f"Unexpected error in ScheduleTool for {item['patient']}: {str(error)}")
+                    outcomes.append((index, ToolHardError(f"An unexpected error occurred: {str(error)}")))
+            outbox.mark_many(DONE, booked)
+            outbox.forget_many(forget)
+        return outcomes
+
+class EmailToolSchema(BaseModel):
+    to: str = Field(..., description="Recipient email address")
+    subject: str = Field(..., description="Email subject")
+    body: str = Field(..., description="Email body content")
+
+class EmailTool(Tool[str]):
+    id: str = "email_tool"
+    name: str = "Email Sender"
+    description: str = "Send emails to patients"
+    args_schema: type[BaseModel] = EmailToolSchema
+    output_schema: tuple[str, str] = ("str", "String output of the email sending result")
+
+    def _get_gmail_service(self):
+        try:
+            return get_client_manager(TOKEN_PATH, CREDENTIALS_PATH, SCOPES).service("gmail", "v1")
+        except Exception as e:
+            logger.error(f"Authentication failed for Gmail: {str(e)}")
+            raise ToolHardError(f"Failed to authenticate with Gmail: {str(e)}")
+
+    def _get_backend(self):
+        """Return the email backend chosen by EMAIL_BACKEND (Gmail by default)."""
+        try:
+            return email_backend(self._get_gmail_service)
+        except ValueError as e:
+            raise ToolHardError(str(e))
+
+    @traced("email_tool.run")
+    def run(self, _: ToolRunContext, to: str, subject: str, body: str) -> str:
+        try:
+            backend = self._get_backend()
+            logger.info(f"Sending email to {to}")
+            backend.send(to, subject, body)
+            return f"Email sent to {to}"
+        except BackendError as error:
+            logger.error(f"Email {backend.name} error: {error}")
+            raise ToolSoftError(f"Failed to send email: {error}")
+        except Exception as e:
+            logger.error(f"Unexpected error in EmailTool: {str(e)}")
+            raise ToolHardError(f"An unexpected error occurred: {str(e)}")
+
+    @traced("email_tool.send_bulk")
+    def send_bulk(self, _: ToolRunContext, items: list[tuple[str, str, str]], max_workers: int = 8, batch_size: int = DEFAULT_BATCH_SIZE, keys: list[str | None] | None = None) -> list:
+        """Send many (to, subject, body) emails through the email backend in batches.
+
+        Gmail encodes messages on a bounded thread pool. `keys` optionally gives an
+        outbox key per email (see outbox.email_key): emails the outbox already records
+        as sent are skipped and answered from it, and each new send is recorded.
+        Returns a result string or a ToolSoftError/ToolHardError per recipient, in order.
+        """
+        if not items:
+            return []
+        keys = keys or [None] * len(items)
+        outbox = get_outbox()
+        checkpoints = outbox.get_many(keys)
+        outcomes = [None] * len(items)
+        to_send = []
+        for index, key in enumerate(keys):
+            status, data = checkpoints.get(key, (None, None))
+            if status == DONE:
+                outcomes[index] = data["result"]
+            else:
+                to_send.append(index)
+        if not to_send:
+            return outcomes
+
+        backend = self._get_backend()
+        logger.info(f"Sending {len(to_send)} emails through {backend.name} in batches of {batch_size}")
+
+        sent = []
+        results = backend.send_many([items[index] for index in to_send], batch_size, max_workers)
+        for index, (_, error) in zip(to_send, results):
+            to = items[index][0]
+            if error is None:
+                outcomes[index] = f"Email sent to {to}"
+                sent.append((keys[index], {"result": outcomes[index]}))
+            elif isinstance(error, BackendError):
+                logger.error(f"Email {backend.name} error for {to}: {error}")
+                outcomes[index] = ToolSoftError(f"Failed to send email: {error}")
+            else:
+                logger.error(f"Unexpected error in EmailTool for {to}: {str(error)}")
+                outcomes[index] = ToolHardError(f"An unexpected error occurred: {str(error)}")
+        # Email has no idempotency key: a message sent just before a crash is sent again on resume
+        outbox.mark_many(DONE, sent)
+        return outcomes
+
+class RequestManagerSchema(BaseModel):
+    action: str = Field(..., description="Action to perform: add, import, prioritize, or list")
+    patient: str | None = Field(None, description="Patient name (required for add)")
+    condition: str | None = Field(None, description="Condition (required for add)")
+    urgency: str | None = Field(None, description="Urgency level: urgent, moderate, routine (triaged from the condition if omitted)")
+    email: str | None = Field(None, description="Patient email (required for add)")
+    path: str | None = Field(None, description="CSV or JSONL file of requests (required for import)")
+
+class RequestManagerTool(Tool[str]):
+    id: str = "request_manager"
+    name: str = "Request Manager"
+    description: str = "Manage patient appointment requests"
+    args_schema: type[BaseModel] = RequestManagerSchema
+    output_schema: tuple[str, str] = ("str", "String output of request actions")
+
+    @traced("request_manager.run")
+    def run(self, _: ToolRunContext, action: str, patient: str | None = None, condition: str | None = None, urgency: str | None = None, email: str | None = None, path: str | None = None) -> str:
+        if action == "add":
+            if not all([patient, condition, email]):
+                logger.error("Missing required fields for add action")
+                raise ToolSoftError("Missing required fields for add action")
+            new_request = {
+                "patient": patient,
+                "condition": condition,
+                "urgency": urgency.lower() if urgency else None,
+                "email": email,
+                "timestamp": datetime.now().isoformat()
+            }
+            triaged = triage_requests([new_request])
+            # With triage off, a request without an urgency is routine as before
+            new_request["urgency"] = new_request["urgency"] or "routine"
+            request_store.append(new_request)
+            request_queue.push(new_request)
+            logger.info(f"Added request for {patient}")
+            if triaged:
+                return f"Added request for {patient} (triaged as {new_request['urgency']})"
+            return f"Added request for {patient}"
+        elif action == "import":
+            if not path:
+                logger.error("Missing path for import action")
+                raise ToolSoftError("Missing path for import action")
+            return self.import_file(path)
+        elif action == "prioritize":
+            prioritized = request_queue.ordered()
+            logger.info("Prioritized requests")
+            return f"Prioritized requests: {[r['patient'] for r in prioritized]}"
+        elif action == "list":
+            logger.info("Listed requests")
+            return f"Current requests: {[r['patient'] for r in request_queue]}"
+        else:
+            logger.error(f"Unknown action: {action}")
+            raise ToolSoftError(f"Unknown action: {action}")
+
+    def import_file(self, path: str) -> str:
+        """Add every valid request in a CSV or JSONL file with one batched write.
+
+        Rows are streamed and validated one at a time against RequestManagerSchema;
+        rejected rows are reported by line number and the rest are still imported.
+        """
+        new_requests = []
+        rejects = []
+        now = datetime.now().isoformat()
+        try:
+            for line_number, row in self._read_rows(path):
+                try:
+                    new_requests.append(self._validate_row(row, now))
+                except ValidationError as e:
+                    rejects.append((line_number, self._describe_validation_error(e)))
+                except ValueError as e:
+                    rejects.append((line_number, str(e)))
+        except (OSError, UnicodeDecodeError) as e:
+            logger.error(f"Cannot read import file {path}: {str(e)}")
+            raise ToolSoftError(f"Cannot read import file {path}: {str(e)}")
+
+        # One triage pass for the whole file: a model call per batch of distinct conditions
+        triaged = triage_requests(new_requests)
+        request_store.append_many(new_requests)
+        for new_request in new_requests:
+            request_queue.push(new_request)
+        logger.info(f"Imported {len(new_requests)} requests from {path}, rejected {len(rejects)}, triaged {triaged}")
+
+        lines = [f"Imported {len(new_requests)} requests from {os.path.basename(path)}"]
+        if triaged:
+            lines.append(f"Triaged the urgency of {triaged} requests from their condition")
+        if rejects:
+            lines.append(f"Rejected {len(rejects)} rows:")
+            lines.extend(f"  line {line_number}: {reason}" for line_number, reason in rejects[:MAX_REPORTED_REJECTS])
+            if len(rejects) > MAX_REPORTED_REJECTS:
+                lines.append(f"  ... and {len(rejects) - MAX_REPORTED_REJECTS} more")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _read_rows(path: str):
+        """Yield (line number, row dict) from a CSV file with a header row or a JSONL file."""
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".csv":
+            # utf-8-sig also reads the byte order mark Excel writes at the start of a CSV
+            with open(path, newline="", encoding="utf-8-sig") as import_file:
+                reader = csv.DictReader(import_file)
+                for row in reader:
+                    yield reader.line_num, row
+        elif extension in (".jsonl", ".ndjson"):
+            with open(path, encoding="utf-8-sig") as import_file:
+                for line_number, line in enumerate(import_file, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        row = None
+                    yield line_number, row
+        else:
+            raise ToolSoftError(f"Unsupported import file type: {extension or path}")
+
+    @staticmethod
+    def _validate_row(row, timestamp: str) -> dict:
+        if not isinstance(row, dict):
+            raise ValueError("Not a valid JSON object")
+        fields = {name: row.get(name) for name in ("patient", "condition", "urgency", "email")}
+        # Empty CSV cells count as missing
+        fields = {name: value.strip() if isinstance(value, str) else value for name, value in fields.items()}
+        RequestManagerSchema(action="add", **fields)
+        triaging = triage_mode() != "off"
+        # A missing or unrecognized urgency is left for triage when it is enabled
+        missing = [name for name, value in fields.items() if not value and not (name == "urgency" and triaging)]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}")
+        fields["urgency"] = fields["urgency"].lower() if fields["urgency"] else None
+        if fields["urgency"] not in URGENCY_SCORES and not triaging:
+            raise ValueError(f"Unknown urgency {fields['urgency']!r}")
+        if row.get("timestamp"):
+            if not isinstance(row["timestamp"], str):
+                raise ValueError(f"Timestamp must be an ISO 8601 string, not {row['timestamp']!r}")
+            datetime.fromisoformat(row["timestamp"])
+            fields["timestamp"] = row["timestamp"]
+        else:
+            fields["timestamp"] = timestamp
+        return fields
+
+    @staticmethod
+    def _describe_validation_error(error: ValidationError) -> str:
+        return "; ".join(f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}" for detail in error.errors())
@@ -0,0 +1,32 @@
+from metrics import span
+
+# Google caps Calendar batches at 50 calls and recommends the same for Gmail
+DEFAULT_BATCH_SIZE = 50
+
+
+def execute_batched(service, api_requests, batch_size=DEFAULT_BATCH_SIZE):
+    """Execute API requests through BatchHttpRequest, batch_size calls per round trip.
+
+    Returns a list of (response, exception) pairs in the same order as api_requests.
+    If a whole batch fails, with an HTTP error or in transport (a socket timeout, a
+    dropped connection), every call in that batch without a response gets the
+    batch's error, and later batches are still sent.
+    """
+    results = [None] * len(api_requests)
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    for start in range(0, len(api_requests), batch_size):
+        chunk = api_requests[start:start + batch_size]
+        batch = service.new_batch_http_request(callback=callback)
+        for offset, api_request in enumerate(chunk):
+            batch.add(api_request, request_id=str(start + offset))
+        try:
+            with span("google_api.batch", size=len(chunk)):
+                batch.execute()
+        except Exception as error:
+            for index in range(start, start + len(chunk)):
+                if results[index] is None:
+                    results[index] = (None, error)
+    return results
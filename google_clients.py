@@ -0,0 +1,172 @@
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Refresh access tokens this long before they expire so API calls never wait on a refresh
+REFRESH_MARGIN = timedelta(minutes=5)
+HTTP_TIMEOUT = 60
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+class GoogleClientManager:
+    """Process-wide cache of Google credentials and API service objects for one token file.
+
+    Credentials are loaded once and refreshed ahead of expiry by a background timer.
+    Service objects are built once per thread (httplib2 connections are not
+    thread-safe) and reuse their keep-alive connection on every call.
+    """
+
+    def __init__(self, token_path, credentials_path, scopes):
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.scopes = list(scopes)
+        self._lock = threading.RLock()
+        self._creds = None
+        self._generation = 0
+        self._refresh_timer = None
+        self._local = threading.local()
+
+    def credentials(self):
+        """Return valid credentials, loading, refreshing or re-authorizing as needed."""
+        with self._lock:
+            if self._creds is None:
+                self._set_credentials(self._load_credentials())
+            elif self._needs_refresh(self._creds):
+                self._refresh()
+            return self._creds
+
+    def service(self, name, version):
+        """Return this thread's cached service object for the given API."""
+        creds = self.credentials()
+        cache = getattr(self._local, "services", None)
+        if cache is None or self._local.generation != self._generation:
+            cache = self._local.services = {}
+            self._local.generation = self._generation
+        if (name, version) not in cache:
+            logger.info(f"Building {name} {version} service")
+            http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            with span("google_api.build", api=name):
+                cache[(name, version)] = build(name, version, http=http, cache_discovery=False)
+        return cache[(name, version)]
+
+    def _load_credentials(self):
+        creds = None
+        logger.info(f"Checking for token at: {self.token_path}")
+        if os.path.exists(self.token_path):
+            creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+            logger.info(f"Loaded {self.token_path}")
+            # Verify all required scopes are present
+            if not creds.has_scopes(self.scopes):
+                logger.warning("Token missing required scopes; re-authenticating")
+                creds = None
+        if creds and self._needs_refresh(creds) and creds.refresh_token:
+            logger.info("Refreshing expired token")
+            with span("oauth.refresh"):
+                creds.refresh(Request())
+            self._save_token(creds)
+        elif not creds or not creds.valid:
+            creds = self._authorize()
+        return creds
+
+    def _authorize(self):
+        logger.info(f"Checking for credentials.json at: {self.credentials_path}")
+        if not os.path.exists(self.credentials_path):
+            raise FileNotFoundError(
+                f"Missing credentials.json at {self.credentials_path}. "
+                "Please download it from Google Cloud Console and place it in the project directory."
+            )
+        logger.info("Initiating OAuth flow with credentials.json")
+        flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
+        creds = flow.run_local_server(port=0)
+        self._save_token(creds)
+        return creds
+
+    def _set_credentials(self, creds):
+        self._creds = creds
+        # New credentials objects invalidate every thread's cached services
+        self._generation += 1
+        self._schedule_refresh()
+
+    @staticmethod
+    def _needs_refresh(creds):
+        if not creds.valid:
+            return True
+        if creds.expiry is None:
+            return False
+        # google-auth stores expiry as a naive UTC datetime
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return creds.expiry - REFRESH_MARGIN <= now
+
+    def _refresh(self):
+        with self._lock:
+            if not self._creds.refresh_token:
+                self._set_credentials(self._authorize())
+                return
+            logger.info("Refreshing token ahead of expiry")
+            with span("oauth.refresh"):
+                self._creds.refresh(Request())
+            self._save_token(self._creds)
+            self._schedule_refresh()
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                if self._needs_refresh(self._creds):
+                    self._refresh()
+                else:
+                    self._schedule_refresh()
+        except Exception as e:
+            # The next credentials() call retries on demand
+            logger.warning(f"Background token refresh failed: {str(e)}")
+
+    def _schedule_refresh(self):
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+        self._refresh_timer = None
+        if self._creds is None or self._creds.expiry is None or not self._creds.refresh_token:
+            return
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        delay = max((self._creds.expiry - REFRESH_MARGIN - now).total_seconds(), 0)
+        self._refresh_timer = threading.Timer(delay, self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _save_token(self, creds):
+        """Atomically replace the token file so concurrent readers never see a partial write."""
+        logger.info(f"Saving token to: {self.token_path}")
+        directory = os.path.dirname(os.path.abspath(self.token_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as token:
+                token.write(creds.to_json())
+            os.replace(tmp_path, self.token_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def get_client_manager(token_path, credentials_path, scopes):
+    """Return the shared client manager for a token file, creating it on first use."""
+    key = os.path.abspath(token_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = GoogleClientManager(token_path, credentials_path, scopes)
+        elif not set(scopes) <= set(manager.scopes):
+            raise ValueError(f"{token_path} is already managed with scopes {manager.scopes}, not {list(scopes)}")
+        return manager
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_LIMIT = 20
+
+
+class HistoryLog:
+    """Append-only JSONL log of session history that has left memory: chat messages, old appointments.
+
+    Each entry is {"time": epoch seconds, "kind": ..., "data": ...}. Writes go to an
+    open file and are flushed per call, so the log survives a crash. With `max_bytes`,
+    a write that would grow the log past it first rotates the log to `path`.1,
+    replacing the previous one, so disk use stays under twice the cap. search()
+    scans both files line by line, so it costs disk reads but no memory. Thread-safe.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._file = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rotated_path(self):
+        return f"{self.path}.1"
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "ab")
+            self._size = self._file.seek(0, os.SEEK_END)
+        return self._file
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        os.replace(self.path, self.rotated_path)
+        logger.info(f"Rotated session history to {self.rotated_path}")
+
+    def append(self, kind, data):
+        self.append_many(kind, [data])
+
+    def append_many(self, kind, items):
+        if not items:
+            return
+        now = time.time()
+        lines = "".join(json.dumps({"time": now, "kind": kind, "data": data}, ensure_ascii=False) + "\n" for data in items).encode("utf-8")
+        with self._lock:
+            try:
+                log_file = self._open()
+                if self.max_bytes is not None and self._size and self._size + len(lines) > self.max_bytes:
+                    self._rotate()
+                    log_file = self._open()
+                log_file.write(lines)
+                log_file.flush()
+                self._size += len(lines)
+            except OSError as e:
+                logger.error(f"Failed to write session history to {self.path}: {str(e)}")
+
+    def search(self, text, kinds=None, limit=DEFAULT_SEARCH_LIMIT):
+        """Return the `limit` most recent entries whose data contains `text` (case-insensitive), oldest first."""
+        needle = text.casefold()
+        matches = deque(maxlen=limit)
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+        for path in (self.rotated_path, self.path):
+            try:
+                log_file = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with log_file:
+                for line in log_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if kinds and entry.get("kind") not in kinds:
+                        continue
+                    data = entry.get("data")
+                    haystack = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+                    if needle in haystack.casefold():
+                        matches.append(entry)
+        return list(matches)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,116 @@
+import threading
+
+# Changes kept for changes_since; a reader further behind gets the whole store instead
+CHANGE_LOG_LIMIT = 10000
+
+
+def _index_key(value):
+    # Names and email addresses are matched case-insensitively
+    return value.casefold() if isinstance(value, str) else value
+
+
+class IndexedStore:
+    """In-memory records keyed by a unique field, with secondary indexes on other fields.
+
+    Adding a record whose key already exists replaces it. Every add and remove is
+    logged so a view can fetch only what changed since it last looked (see changes_since).
+    Lookups by key or by any indexed field are O(1); string fields are indexed
+    case-insensitively. With `max_records`, adding beyond the cap evicts the records
+    least recently added and passes them to `on_evict`, so memory stays flat however
+    long the store lives. Thread-safe.
+    """
+
+    def __init__(self, key, indexes=(), max_records=None, on_evict=None):
+        self.key = key
+        self.max_records = max_records
+        self.on_evict = on_evict
+        self._records = {}
+        self._indexes = {field: {} for field in indexes}
+        self._changes = []
+        # Position of self._changes[0] in the full change history
+        self._changes_base = 0
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        evicted = []
+        with self._lock:
+            key = record[self.key]
+            previous = self._records.pop(key, None)
+            if previous is not None:
+                self._unindex(previous)
+            # Re-adding a record makes it the most recent, so it is evicted last
+            self._records[key] = record
+            for field, index in self._indexes.items():
+                index.setdefault(_index_key(record.get(field)), {})[key] = record
+            self._changes.append(key)
+            while self.max_records is not None and len(self._records) > self.max_records:
+                oldest = self._records.pop(next(iter(self._records)))
+                self._unindex(oldest)
+                self._changes.append(oldest[self.key])
+                evicted.append(oldest)
+            self._trim_changes()
+        if evicted and self.on_evict is not None:
+            self.on_evict(evicted)
+
+    def _trim_changes(self):
+        if len(self._changes) > CHANGE_LOG_LIMIT:
+            dropped = len(self._changes) - CHANGE_LOG_LIMIT // 2
+            del self._changes[:dropped]
+            self._changes_base += dropped
+
+    def remove(self, key):
+        """Remove and return the record with `key`, or None if there is none."""
+        with self._lock:
+            record = self._records.pop(key, None)
+            if record is not None:
+                self._unindex(record)
+                self._changes.append(key)
+                self._trim_changes()
+            return record
+
+    def _unindex(self, record):
+        key = record[self.key]
+        for field, index in self._indexes.items():
+            value = _index_key(record.get(field))
+            bucket = index.get(value)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del index[value]
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._records.get(key, default)
+
+    def find(self, field, value):
+        """Return the records whose indexed `field` equals `value`, in the order they were added."""
+        with self._lock:
+            return list(self._indexes[field].get(_index_key(value), {}).values())
+
+    def changes_since(self, position):
+        """Return (records added or replaced, keys removed, new position) for the changes after `position`.
+
+        If the changes after `position` were already trimmed from the log, every record
+        is returned and the removed keys are None: the reader should replace its view.
+        """
+        with self._lock:
+            end = self._changes_base + len(self._changes)
+            if position < self._changes_base:
+                return list(self._records.values()), None, end
+            keys = dict.fromkeys(self._changes[position - self._changes_base:])
+            return (
+                [self._records[key] for key in keys if key in self._records],
+                [key for key in keys if key not in self._records],
+                end,
+            )
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        # Iterate over a snapshot so callers never see a concurrent modification
+        with self._lock:
+            return iter(list(self._records.values()))
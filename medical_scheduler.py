@@ -1,18 +1,24 @@
 import os
+import sys
+import json
+import time
+import argparse
 import datetime
+import hashlib
+import multiprocessing
+import threading
 import uuid
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from types import SimpleNamespace
 from dotenv import load_dotenv
-from portia import (
-    Config,
-    LLMModel,
-    LLMProvider,
-    Portia,
-    InMemoryToolRegistry,
-    ToolRunContext,
-)
-from portia.errors import ToolHardError, ToolSoftError
-from ScheduleTool import ScheduleTool
-from EmailTool import EmailTool
+from calendar_shards import configure_calendar_shards, get_calendar_shards
+from metrics import metrics, span
+from outbox import configure_outbox, email_key, get_outbox, schedule_key
+from pipeline import DEFAULT_QUEUE_SIZE, Stage, run_pipeline
+from request_queue import RequestQueue
+from request_store import REQUESTS_LOG_PATH, SAMPLE_REQUESTS, RequestStore
+from slot_allocator import PROVIDERS
+from triage import triage_requests
 
 # Load environment variables
 load_dotenv()
@@ -24,111 +30,373 @@ assert GOOGLE_API_KEY, "GOOGLE_API_KEY is not set"
 if not os.getenv("PORTIA_API_KEY"):
     print("Warning: PORTIA_API_KEY not set, cloud features may be unavailable")
 
-# Configure Portia with Google Gemini
-google_config = Config.from_default(
-    llm_provider=LLMProvider.GOOGLE_GENERATIVE_AI,
-    llm_model_name=LLMModel.GEMINI_2_0_FLASH,
-    google_api_key=GOOGLE_API_KEY
-)
-
-# Mock patient requests
-requests = [
-    {"patient": "John Doe", "condition": "chest pain", "urgency": "urgent", "email": "jimstse@gmail.com", "timestamp": "2025-04-12T08:00:00"},
-    {"patient": "Jane Smith", "condition": "annual checkup", "urgency": "routine", "email": "jane@example.com", "timestamp": "2025-04-12T08:05:00"},
-    {"patient": "Bob Lee", "condition": "diabetes follow-up", "urgency": "moderate", "email": "bob@example.com", "timestamp": "2025-04-12T08:10:00"}
-]
-
-# Prioritization logic
-def prioritize_requests(requests):
-    urgency_scores = {"urgent": 3, "moderate": 2, "routine": 1}
-    for req in requests:
-        req["score"] = urgency_scores.get(req["urgency"], 1)
-    return sorted(requests, key=lambda x: (x["score"], x["timestamp"]), reverse=True)
+# The log is read when main() runs, not at import time
+request_store = RequestStore(REQUESTS_LOG_PATH)
 
-# Initialize tools
-schedule_tool = ScheduleTool()
-email_tool = EmailTool()
+# Batch mode defaults: requests prioritized together, and requests per worker task
+DEFAULT_WINDOW = 1000
+DEFAULT_CHUNK_SIZE = 50
+# Urgency may be omitted: it is then triaged from the condition (see triage.py)
+REQUIRED_FIELDS = ("patient", "condition", "email")
+# Fields that must be strings when given; other types would break hashing, triage and the queue
+STRING_FIELDS = ("id", "patient", "condition", "urgency", "email", "timestamp")
 
-# Initialize tool registry
-tool_registry = InMemoryToolRegistry()
-tool_registry.register_tool(schedule_tool)
-tool_registry.register_tool(email_tool)
+_runtime = None
+_runtime_lock = threading.Lock()
 
-# Initialize Portia
-portia = Portia(config=google_config, tools=tool_registry)
+def get_runtime():
+    """Build the Portia config, tools and Portia instance on first use; importing them is slow."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is not None:
+            return _runtime
+        from portia import Config, InMemoryToolRegistry, LLMModel, LLMProvider, Portia
+        from ScheduleTool import ScheduleTool
+        from EmailTool import EmailTool
 
-# Process appointments
-def process_appointments(requests):
-    prioritized = prioritize_requests(requests)
-    appointments = []
+        # Configure Portia with Google Gemini
+        google_config = Config.from_default(
+            llm_provider=LLMProvider.GOOGLE_GENERATIVE_AI,
+            llm_model_name=LLMModel.GEMINI_2_0_FLASH,
+            google_api_key=GOOGLE_API_KEY
+        )
+
+        # Initialize tools and tool registry
+        schedule_tool = ScheduleTool()
+        email_tool = EmailTool()
+        tool_registry = InMemoryToolRegistry()
+        tool_registry.register_tool(schedule_tool)
+        tool_registry.register_tool(email_tool)
+
+        _runtime = SimpleNamespace(
+            google_config=google_config,
+            schedule_tool=schedule_tool,
+            email_tool=email_tool,
+            tool_registry=tool_registry,
+            portia=Portia(config=google_config, tools=tool_registry),
+        )
+    return _runtime
+
+def describe_error(req, error):
+    """Return the (status, message) recorded for a request that failed with `error`."""
+    from portia.errors import ToolHardError, ToolSoftError
+
+    if isinstance(error, ToolHardError):
+        return "critical", f"Critical error for {req['patient']}: {error}"
+    if isinstance(error, ToolSoftError):
+        return "recoverable", f"Recoverable error for {req['patient']}: {error}"
+    return "unexpected", f"Unexpected error for {req['patient']}: {error}"
+
+def appointment_date(req, now):
+    """Pick the earliest appointment date for a request based on its urgency."""
+    if req["urgency"] == "urgent":
+        return (now + datetime.timedelta(hours=1)).strftime("%Y-%m-%d")
+    if req["urgency"] == "moderate":
+        return (now + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+    return (now + datetime.timedelta(days=3)).strftime("%Y-%m-%d")
+
+def schedule_and_email(requests, schedule_workers=1, email_workers=1, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_CHUNK_SIZE):
+    """Book and confirm requests, returning one outcome dict per request in the order given.
+
+    Booking and emailing run as a pipeline: each batch of booked appointments is
+    queued for the email stage straight away, so emails go out while later batches
+    are still being scheduled. Both stages checkpoint through the outbox by request
+    id, so rerunning requests after a crash skips the bookings and emails that
+    already happened. Successful outcomes have status "scheduled"; failures carry
+    the error status and message.
+    """
+    from portia import ToolRunContext
+    from portia.errors import ToolHardError
+    from ScheduleTool import parse_schedule_result
+    from EmailTool import REMINDER_SUBJECT
+
+    runtime = get_runtime()
     # Initialize ToolRunContext with a valid plan_run_id prefixed with "prun-"
     context = ToolRunContext(
         execution_context={"user": "system", "session": "default"},
         plan_run_id=f"prun-{uuid.uuid4()}",  # Prepend "prun-" to the UUID
-        config=google_config,
+        config=runtime.google_config,
         clarifications=[]
     )
+    outcomes = {}
+
+    def fail(req, error):
+        status, message = describe_error(req, error)
+        outcomes[id(req)] = {"id": req.get("id"), "patient": req["patient"], "email": req["email"], "status": status, "error": message}
 
-    for req in prioritized:
+    def schedule_batch(batch):
+        """Book a batch in batched Calendar calls and return the booked (request, slot, email body) triples."""
+        now = datetime.datetime.now()
         try:
-            # Determine appointment date based on urgency
-            now = datetime.datetime.now()
-            if req["urgency"] == "urgent":
-                appt_date = (now + datetime.timedelta(hours=1)).strftime("%Y-%m-%d")
-            elif req["urgency"] == "moderate":
-                appt_date = (now + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-            else:
-                appt_date = (now + datetime.timedelta(days=3)).strftime("%Y-%m-%d")
-
-            # Schedule using ScheduleTool
-            schedule_result = schedule_tool.run(context, appt_date)
-            slot = {
-                "patient": req["patient"],
-                "condition": req["condition"],
-                "start_time": f"{appt_date}T10:00:00",
-                "end_time": f"{appt_date}T11:00:00",
-                "event_id": schedule_result.split("Event ID: ")[1]
-            }
+            schedule_results = runtime.schedule_tool.run_batch(
+                context,
+                [appointment_date(req, now) for req in batch],
+                keys=[schedule_key(req["id"]) for req in batch],
+                requests=batch,
+            )
+        except ToolHardError as e:
+            schedule_results = [e] * len(batch)
+
+        booked = []
+        for req, schedule_result in zip(batch, schedule_results):
+            try:
+                # Surface the per-patient scheduling error through the handler below
+                if isinstance(schedule_result, Exception):
+                    raise schedule_result
+                start_time, event_id = parse_schedule_result(schedule_result)
+                slot = {
+                    "patient": req["patient"],
+                    "condition": req["condition"],
+                    "start_time": start_time,
+                    "end_time": (datetime.datetime.fromisoformat(start_time) + get_calendar_shards().route(req).allocator.slot_length).isoformat(),
+                    "event_id": event_id
+                }
+                email_body = (
+                    f"Dear {req['patient']},\n"
+                    f"Your appointment is scheduled for {slot['start_time']}.\n"
+                    f"Reason: {req['condition']}\n"
+                    f"Best regards,\nYour Clinic"
+                )
+                booked.append((req, slot, email_body))
+            except Exception as e:
+                fail(req, e)
+        return booked
 
-            # Send email using EmailTool
-            email_body = (
-                f"Dear {req['patient']},\n"
-                f"Your appointment is scheduled for {slot['start_time']}.\n"
-                f"Reason: {req['condition']}\n"
-                f"Best regards,\nYour Clinic"
+    def email_batch(booked):
+        """Send a batch of confirmation emails in one bulk dispatch."""
+        try:
+            email_results = runtime.email_tool.send_bulk(
+                context,
+                [(req["email"], REMINDER_SUBJECT, email_body) for req, _, email_body in booked],
+                keys=[email_key(req["id"]) for req, _, _ in booked]
             )
-            email_result = email_tool.run(context, req["email"])
+        except ToolHardError as e:
+            email_results = [e] * len(booked)
 
-            appointments.append({
+        for (req, slot, _), email_result in zip(booked, email_results):
+            if isinstance(email_result, Exception):
+                fail(req, email_result)
+                continue
+            outcomes[id(req)] = {
+                "id": req.get("id"),
                 "patient": req["patient"],
                 "email": req["email"],
                 "slot": slot,
-                "email_status": email_result
-            })
+                "email_status": email_result,
+                "status": "scheduled"
+            }
+        return []
 
-        except ToolHardError as e:
-            print(f"Critical error for {req['patient']}: {e}")
+    run_pipeline(
+        requests,
+        [Stage("schedule", schedule_batch, schedule_workers, batch_size), Stage("email", email_batch, email_workers, batch_size)],
+        queue_size=queue_size,
+    )
+    # A stage batch that raised outright leaves its requests without an outcome
+    for req in requests:
+        if id(req) not in outcomes:
+            fail(req, RuntimeError("the pipeline dropped this request, see the log"))
+    return [outcomes[id(req)] for req in requests]
+
+# Process appointments
+def process_appointments(requests, schedule_workers=1, email_workers=1, queue_size=DEFAULT_QUEUE_SIZE):
+    # Accept a plain list too; either way requests are consumed highest priority first
+    queue = requests if isinstance(requests, RequestQueue) else RequestQueue(requests)
+    prioritized = queue.pop_many()
+    appointments = []
+    finished_ids = []
+    for outcome in schedule_and_email(prioritized, schedule_workers, email_workers, queue_size):
+        if outcome["status"] != "scheduled":
+            print(outcome["error"])
+            continue
+        finished_ids.append(outcome["id"])
+        appointments.append({
+            "patient": outcome["patient"],
+            "email": outcome["email"],
+            "slot": outcome["slot"],
+            "email_status": outcome["email_status"]
+        })
+    # Booked and confirmed requests leave the pending log; the rest stay, and a rerun
+    # resumes them from their outbox checkpoints instead of booking them again
+    request_store.remove_many(finished_ids)
+    get_outbox().forget_many([key(request_id) for request_id in finished_ids for key in (schedule_key, email_key)])
+    return appointments
+
+def read_requests(stream):
+    """Yield (line number, request or None, error) for each non-blank JSON line of `stream`."""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            req = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(req, dict):
+            yield line_number, None, "Expected a JSON object"
             continue
-        except ToolSoftError as e:
-            print(f"Recoverable error for {req['patient']}: {e}")
+        wrong_type = [field for field in STRING_FIELDS if req.get(field) is not None and not isinstance(req[field], str)]
+        if wrong_type:
+            yield line_number, None, f"Fields must be strings: {', '.join(wrong_type)}"
             continue
-        except Exception as e:
-            print(f"Unexpected error for {req['patient']}: {e}")
+        missing = [field for field in REQUIRED_FIELDS if not (req.get(field) or "").strip()]
+        if missing:
+            yield line_number, None, f"Missing fields: {', '.join(missing)}"
             continue
+        if not req.get("timestamp"):
+            req["timestamp"] = datetime.datetime.now().isoformat()
+        if not req.get("id"):
+            # Requests without an id get one derived from their line, so rerunning the same file resumes from the outbox
+            req["id"] = f"line-{line_number}-{hashlib.sha1(line.strip().encode()).hexdigest()[:12]}"
+        yield line_number, req, None
 
-    return appointments
+def prioritized_windows(stream, window, rejected):
+    """Yield the requests of `stream` in priority order, `window` requests at a time.
+
+    Only one window is held in memory, so arbitrarily long inputs stream through.
+    Each window is triaged in one pass before it is ranked, so a window costs a model
+    call per batch of unseen conditions. Lines that fail validation are passed to
+    `rejected` instead.
+    """
+    pending = []
+    pending_ids = set()
+    for line_number, req, error in read_requests(stream):
+        if error is None and req["id"] in pending_ids:
+            error = f"Duplicate request id: {req['id']}"
+        if error:
+            rejected({"line": line_number, "status": "rejected", "error": error})
+            continue
+        req["line"] = line_number
+        pending.append(req)
+        pending_ids.add(req["id"])
+        if len(pending) >= window:
+            triage_requests(pending)
+            yield RequestQueue(pending).pop_many()
+            pending = []
+            pending_ids.clear()
+    if pending:
+        triage_requests(pending)
+        yield RequestQueue(pending).pop_many()
+
+def _init_worker(counter, workers):
+    """Give each worker process its own share of every calendar's providers so processes never double-book."""
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    configure_calendar_shards(providers=PROVIDERS // workers + (1 if index < PROVIDERS % workers else 0))
+
+def process_chunk(requests):
+    """Worker task: schedule and email a chunk of requests, returning JSON-ready outcomes."""
+    with span("batch.chunk", size=len(requests)):
+        outcomes = schedule_and_email(requests)
+    for req, outcome in zip(requests, outcomes):
+        outcome["line"] = req.get("line")
+    return outcomes
+
+def run_batch(input_stream, output_stream, window=DEFAULT_WINDOW, workers=4, executor="thread", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Schedule every request in a JSONL stream on a worker pool, writing one JSON result per line.
+
+    Requests are prioritized within each window, split into chunks and fanned out to the
+    pool. At most two chunks per worker are in flight, so memory stays bounded however
+    long the input is. Results are written as soon as their chunk completes.
+    Returns a dict of counts per status.
+    """
+    counts = {}
+
+    def write(outcome):
+        counts[outcome["status"]] = counts.get(outcome["status"], 0) + 1
+        output_stream.write(json.dumps(outcome) + "\n")
+
+    if executor == "process":
+        # Each process allocates from a private slot table, so there is no point in more processes than providers
+        workers = min(workers, PROVIDERS)
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(multiprocessing.Value("i", 0), workers)
+        )
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    in_flight = set()
+
+    def drain(return_when):
+        done, pending = wait(in_flight, return_when=return_when)
+        in_flight.intersection_update(pending)
+        for future in done:
+            for outcome in future.result():
+                write(outcome)
+        output_stream.flush()
+
+    with pool:
+        for requests in prioritized_windows(input_stream, window, write):
+            for start in range(0, len(requests), chunk_size):
+                if len(in_flight) >= 2 * workers:
+                    drain(FIRST_COMPLETED)
+                in_flight.add(pool.submit(process_chunk, requests[start:start + chunk_size]))
+        if in_flight:
+            drain(ALL_COMPLETED)
+    output_stream.flush()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule patient requests and send confirmation emails.")
+    parser.add_argument("--input", help="JSONL file of requests to process in batch mode, or - for stdin; "
+                                        "without it the pending request log is processed")
+    parser.add_argument("--output", default="-", help="where batch results are written as JSONL (default: stdout)")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="requests prioritized together")
+    parser.add_argument("--workers", type=int, default=4, help="parallel scheduling workers")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="requests per worker task")
+    parser.add_argument("--schedule-workers", type=int, default=1,
+                        help="pipeline workers booking the pending request log")
+    parser.add_argument("--email-workers", type=int, default=1,
+                        help="pipeline workers sending confirmations for the pending request log")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="booked appointments allowed to wait for the email stage")
+    parser.add_argument("--outbox", help="SQLite file recording finished bookings and emails so an interrupted run "
+                                         "can be resumed (default: OUTBOX_PATH or outbox.sqlite3)")
+    parser.add_argument("--metrics", help="write Prometheus metrics here after a batch run (thread executor only)")
+    parser.add_argument("--trace", help="write a JSONL span trace here after a batch run (thread executor only)")
+    args = parser.parse_args()
+    if args.outbox:
+        configure_outbox(args.outbox)
+
+    if args.input:
+        run_batch_cli(args)
+        return
+
+    request_queue = RequestQueue(request_store.load(seed=SAMPLE_REQUESTS))
+    try:
+        # Step 1: Prioritize
+        print("Prioritizing requests...")
+        print("Prioritized Requests:", request_queue.ordered())
+
+        # Step 2: Process appointments (schedule and email)
+        print("Scheduling and emailing...")
+        appointments = process_appointments(request_queue, args.schedule_workers, args.email_workers, args.queue_size)
+        print("Scheduled Appointments:", appointments)
 
-# Execute
-try:
-    # Step 1: Prioritize
-    print("Prioritizing requests...")
-    prioritized = prioritize_requests(requests)
-    print("Prioritized Requests:", prioritized)
+    except Exception as e:
+        print(f"Error: {e}")
 
-    # Step 2: Process appointments (schedule and email)
-    print("Scheduling and emailing...")
-    appointments = process_appointments(prioritized)
-    print("Scheduled Appointments:", appointments)
+def run_batch_cli(args):
+    input_stream = sys.stdin if args.input == "-" else open(args.input)
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w")
+    started = time.perf_counter()
+    try:
+        counts = run_batch(input_stream, output_stream, args.window, args.workers, args.executor, args.chunk_size)
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+    elapsed = time.perf_counter() - started
+    if args.metrics:
+        metrics.write_prometheus(args.metrics)
+    if args.trace:
+        metrics.write_trace(args.trace)
+    total = sum(counts.values())
+    summary = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+    print(f"Processed {total} requests in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f}/s). {summary}", file=sys.stderr)
 
-except Exception as e:
-    print(f"Error: {e}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
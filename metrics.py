@@ -0,0 +1,196 @@
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram bucket bounds in seconds, Prometheus style
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+# Finished spans kept in memory for the JSONL trace
+TRACE_LIMIT = 10000
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Metrics:
+    """Counters, latency histograms and a bounded trace of finished spans. Thread-safe."""
+
+    def __init__(self, trace_limit=TRACE_LIMIT):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._trace = deque(maxlen=trace_limit)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][index] += 1
+                    break
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def record_span(self, record):
+        self.observe(record["name"], record["duration"])
+        if record["error"]:
+            self.increment("span_errors", span=record["name"])
+        with self._lock:
+            self._trace.append(record)
+
+    def summary(self):
+        """Return {span name: (count, mean seconds)} for every span seen so far."""
+        with self._lock:
+            return {
+                name: (histogram["count"], histogram["sum"] / histogram["count"])
+                for name, histogram in sorted(self._histograms.items())
+            }
+
+    def prometheus_text(self):
+        """Render counters and span histograms in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((name, dict(h, buckets=list(h["buckets"]))) for name, h in self._histograms.items())
+        lines = []
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {name}_total counter")
+            for (counter_name, labels), value in counters:
+                if counter_name == name:
+                    lines.append(f"{name}_total{_format_labels(labels)} {value}")
+        if histograms:
+            lines.append("# TYPE span_duration_seconds histogram")
+        for name, histogram in histograms:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"span_duration_seconds_bucket{_format_labels((('span', name), ('le', le)))} {cumulative}")
+            lines.append(f"span_duration_seconds_sum{_format_labels((('span', name),))} {histogram['sum']}")
+            lines.append(f"span_duration_seconds_count{_format_labels((('span', name),))} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w") as metrics_file:
+            metrics_file.write(self.prometheus_text())
+
+    def write_trace(self, path):
+        """Write the retained spans as JSONL, one finished span per line, oldest first."""
+        with self._lock:
+            records = list(self._trace)
+        with open(path, "w") as trace_file:
+            for record in records:
+                trace_file.write(json.dumps(record, default=str) + "\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a span nested under the current one, recording it in `metrics`.
+
+    The parent is tracked with a context variable, so spans nest across function
+    calls; work handed to another thread nests only if it runs in a copied context.
+    """
+    parent = _current_span.get()
+    record = {
+        "id": next(_span_ids),
+        "parent": parent["id"] if parent else None,
+        "name": name,
+        "thread": threading.current_thread().name,
+        "start": time.time(),
+        "attributes": attributes,
+        "error": None,
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - started
+        _current_span.reset(token)
+        metrics.record_span(record)
+
+
+def traced(name):
+    """Decorator form of span() for functions and methods."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StallWatchdog:
+    """Reports Tk main-loop stalls longer than `threshold` seconds.
+
+    A heartbeat scheduled with root.after stamps the time on every tick; a daemon
+    thread warns as soon as the stamp is older than the threshold, while the loop is
+    still blocked. Each stall's full length goes into the "tk.stall" histogram.
+    """
+
+    def __init__(self, root, threshold=0.25, interval=0.05):
+        self.root = root
+        self.threshold = threshold
+        self.interval = interval
+        self._last_beat = time.monotonic()
+        self._stalled_since = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._beat()
+        threading.Thread(target=self._watch, name="tk-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _beat(self):
+        now = time.monotonic()
+        with self._lock:
+            stalled_since, self._stalled_since = self._stalled_since, None
+            self._last_beat = now
+        if stalled_since is not None:
+            duration = now - stalled_since
+            metrics.observe("tk.stall", duration)
+            logger.warning(f"Tk main loop was blocked for {duration:.2f}s")
+        if not self._stopped.is_set():
+            self.root.after(int(self.interval * 1000), self._beat)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                # The heartbeat is due every interval, so only the delay beyond that counts
+                blocked = time.monotonic() - self._last_beat - self.interval
+                if blocked < self.threshold or self._stalled_since is not None:
+                    continue
+                self._stalled_since = self._last_beat + self.interval
+            metrics.increment("tk_stalls")
+            logger.warning(f"Tk main loop blocked for more than {self.threshold:.2f}s")
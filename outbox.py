@@ -0,0 +1,142 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Used when OUTBOX_PATH is not set
+DEFAULT_OUTBOX_PATH = os.path.join(BASE_DIR, "outbox.sqlite3")
+
+# A step is "started" once its side effect may have happened and "done" once its outcome is recorded
+STARTED = "started"
+DONE = "done"
+
+
+def schedule_key(request_id):
+    return f"schedule:{request_id}"
+
+
+def email_key(request_id):
+    return f"email:{request_id}"
+
+
+def event_id(calendar_id, key):
+    """Return the Calendar event id for a step: the same calendar and key always give the same id.
+
+    Calendar rejects a second insert with an id it already holds (409), so retrying a
+    step whose insert may have landed cannot create a duplicate event. Ids must use
+    the base32hex alphabet (a-v, 0-9).
+    """
+    digest = hashlib.sha256(f"{calendar_id}\n{key}".encode()).digest()
+    return base64.b32hexencode(digest).decode().rstrip("=").lower()
+
+
+class Outbox:
+    """Durable record of the side effects (calendar events, emails) of scheduling runs.
+
+    Each step is stored under an idempotency key, e.g. schedule_key(request id), with
+    its status and a JSON payload. A run marks a step started before calling the API
+    and done with its result afterwards, so a rerun after a crash or a ToolHardError
+    skips finished steps and retries only the rest. Backed by SQLite in WAL mode, so
+    threads and worker processes can share one file. Thread-safe.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        # A connection must not cross a fork, so worker processes open their own
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS outbox "
+                "(key TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def get_many(self, keys):
+        """Return {key: (status, data)} for the keys that have a recorded step."""
+        keys = [key for key in keys if key is not None]
+        found = {}
+        with self._lock:
+            connection = self._connect()
+            # Stay well under SQLite's limit on query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = connection.execute(
+                    f"SELECT key, status, data FROM outbox WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                )
+                for key, status, data in rows:
+                    found[key] = (status, json.loads(data))
+        return found
+
+    def mark_many(self, status, entries):
+        """Record (key, data) entries with `status` in one transaction, replacing earlier records."""
+        entries = [(key, data) for key, data in entries if key is not None]
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.executemany(
+                    "INSERT OR REPLACE INTO outbox (key, status, data, updated) VALUES (?, ?, ?, ?)",
+                    [(key, status, json.dumps(data), now) for key, data in entries],
+                )
+
+    def forget_many(self, keys):
+        """Drop the records of steps that will never be retried, e.g. of requests no longer pending."""
+        keys = [key for key in keys if key is not None]
+        if not keys:
+            return
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.executemany("DELETE FROM outbox WHERE key = ?", [(key,) for key in keys])
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """Return the process-wide outbox at OUTBOX_PATH (default outbox.sqlite3 in the project folder)."""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox(os.getenv("OUTBOX_PATH", DEFAULT_OUTBOX_PATH))
+        return _outbox
+
+
+def configure_outbox(path):
+    """Replace the process-wide outbox, e.g. to give a batch run its own checkpoint file."""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is not None:
+            _outbox.close()
+        _outbox = Outbox(path)
+        return _outbox
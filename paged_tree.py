@@ -0,0 +1,80 @@
+import itertools
+from tkinter import ttk
+
+PAGE_SIZE = 200
+
+
+class PagedTreeview:
+    """A ttk.Treeview that shows one page of a large row set and applies changes as diffs.
+
+    Rows are kept in an insertion-ordered dict keyed by a stable id. Only the rows on
+    the current page exist as Tk items, so refreshing costs at most PAGE_SIZE widget
+    operations no matter how many rows there are.
+    """
+
+    def __init__(self, parent, columns, page_size=PAGE_SIZE):
+        self.page_size = page_size
+        self.page = 0
+        self._rows = {}
+        self._shown = {}
+
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings")
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=100)
+        self.tree.pack(fill="both", expand=True, padx=5, pady=5)
+
+        pager = ttk.Frame(parent)
+        pager.pack(fill="x", padx=5)
+        ttk.Button(pager, text="<", width=3, command=lambda: self.show_page(self.page - 1)).pack(side="left")
+        self.page_label = ttk.Label(pager)
+        self.page_label.pack(side="left", expand=True)
+        ttk.Button(pager, text=">", width=3, command=lambda: self.show_page(self.page + 1)).pack(side="right")
+        self.render()
+
+    def update(self, rows):
+        """Insert or update (row_id, values) pairs, then redraw the current page."""
+        for row_id, values in rows:
+            self._rows[row_id] = tuple(values)
+        self.render()
+
+    def sync(self, rows):
+        """Make the row set exactly (row_id, values) pairs, keeping the order given."""
+        self._rows = {row_id: tuple(values) for row_id, values in rows}
+        self.render()
+
+    def remove(self, row_ids):
+        for row_id in row_ids:
+            self._rows.pop(row_id, None)
+        self.render()
+
+    def page_count(self):
+        return max((len(self._rows) + self.page_size - 1) // self.page_size, 1)
+
+    def show_page(self, page):
+        self.page = min(max(page, 0), self.page_count() - 1)
+        self.render()
+
+    def render(self):
+        """Diff the current page against the Tk items on screen and apply only the changes."""
+        self.page = min(self.page, self.page_count() - 1)
+        start = self.page * self.page_size
+        visible = dict(itertools.islice(self._rows.items(), start, start + self.page_size))
+
+        if list(visible) != list(self._shown):
+            for row_id in self._shown.keys() - visible.keys():
+                self.tree.delete(row_id)
+            for index, (row_id, values) in enumerate(visible.items()):
+                if row_id in self._shown:
+                    self.tree.move(row_id, "", index)
+                else:
+                    self.tree.insert("", index, iid=row_id, values=values)
+                    self._shown[row_id] = values
+        for row_id, values in visible.items():
+            if self._shown.get(row_id) != values:
+                self.tree.item(row_id, values=values)
+        self._shown = visible
+        self.page_label.config(text=f"Page {self.page + 1}/{self.page_count()} ({len(self._rows)} rows)")
+
+    def __len__(self):
+        return len(self._rows)
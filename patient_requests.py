@@ -0,0 +1,6 @@
+from request_queue import RequestQueue
+from request_store import REQUESTS_LOG_PATH, SAMPLE_REQUESTS, RequestStore
+
+# Pending requests shared by the chat UI and its tools
+request_store = RequestStore(REQUESTS_LOG_PATH)
+request_queue = RequestQueue(request_store.load(seed=SAMPLE_REQUESTS))
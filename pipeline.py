@@ -0,0 +1,96 @@
+import logging
+import queue
+import threading
+
+from google_batch import DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Items allowed to wait between two stages before the upstream stage blocks
+DEFAULT_QUEUE_SIZE = 200
+# How long a stage waits for more items before running a partial batch
+DEFAULT_LINGER = 0.05
+
+_DONE = object()
+
+
+class Stage:
+    """One pipeline step: `func(batch)` handles a list of items and returns the items for the next stage."""
+
+    def __init__(self, name, func, workers=1, batch_size=DEFAULT_BATCH_SIZE):
+        if workers < 1 or batch_size < 1:
+            raise ValueError("A stage needs at least one worker and a batch size of at least one")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+
+
+def run_pipeline(items, stages, queue_size=DEFAULT_QUEUE_SIZE, linger=DEFAULT_LINGER):
+    """Stream `items` through `stages`, each running on its own workers, connected by bounded queues.
+
+    An item moves on as soon as its batch is done, so a downstream stage starts
+    while the upstream one is still working and the end-to-end time approaches that
+    of the slowest stage rather than the sum of all of them. A full queue blocks the stage
+    feeding it, which bounds memory. A batch whose func raises is logged and dropped,
+    so stage functions should turn per-item failures into results themselves.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    remaining = [stage.workers for stage in stages]
+    lock = threading.Lock()
+
+    def finish(index):
+        # The last worker of a stage tells every worker of the next stage to stop
+        with lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last and index + 1 < len(stages):
+            for _ in range(stages[index + 1].workers):
+                queues[index + 1].put(_DONE)
+
+    def next_batch(inbox, batch_size):
+        """Return (batch, done): wait for one item, then take whatever arrives within `linger`."""
+        batch = []
+        while len(batch) < batch_size:
+            try:
+                item = inbox.get(timeout=linger) if batch else inbox.get()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def work(index):
+        stage = stages[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        done = False
+        try:
+            while not done:
+                batch, done = next_batch(queues[index], stage.batch_size)
+                if not batch:
+                    continue
+                try:
+                    results = stage.func(batch)
+                except Exception as e:
+                    logger.error(f"Pipeline stage {stage.name} failed on a batch of {len(batch)}: {str(e)}")
+                    continue
+                if outbox is not None:
+                    for result in results:
+                        outbox.put(result)
+        finally:
+            finish(index)
+
+    threads = [
+        threading.Thread(target=work, args=(index,), name=f"{stage.name}-{worker}", daemon=True)
+        for index, stage in enumerate(stages)
+        for worker in range(stage.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for item in items:
+        queues[0].put(item)
+    for _ in range(stages[0].workers):
+        queues[0].put(_DONE)
+    for thread in threads:
+        thread.join()
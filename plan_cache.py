@@ -0,0 +1,140 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+
+# Capitalized at the start of a command, these are the command and not part of a name
+COMMAND_VERBS = (
+    "Add", "Book", "Cancel", "Check", "Email", "Find", "List", "Move", "Notify",
+    "Please", "Remind", "Reschedule", "Schedule", "Search", "Send", "Show",
+)
+
+# Argument values that vary between commands of the same shape, most specific first.
+# Names are runs of capitalized words, or a single capitalized word after "for", "to" or "patient".
+_SLOT_PATTERN = re.compile(
+    r"""(?P<TEXT>"[^"]+"|'[^']+')"""
+    r"|(?P<EMAIL>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)"
+    r"|(?P<DATE>\b\d{4}-\d{2}-\d{2}\b)"
+    r"|(?P<TIME>\b\d{1,2}:\d{2}(?:\s?[ap]m)?\b)"
+    r"|(?P<URGENCY>\b(?:urgent|moderate|routine)\b)"
+    rf"|(?P<NAME>\b(?!(?:{'|'.join(COMMAND_VERBS)})\b)[A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+)+\b"
+    r"|(?<=\bfor )[A-Z][a-z'-]+\b|(?<=\bto )[A-Z][a-z'-]+\b|(?<=\bpatient )[A-Z][a-z'-]+\b)"
+    r"|(?P<NUMBER>\b\d+(?:\.\d+)?\b)"
+)
+_URGENCY_WORD = re.compile(r"\b(?:urgent|moderate|routine)\b", re.IGNORECASE)
+
+PLANNING_NOTE = (
+    "Values written like <NAME_1> or <EMAIL_1> are placeholders for the real arguments. "
+    "Copy them unchanged into the tool arguments and task descriptions."
+)
+
+
+def normalize_intent(command):
+    """Split a command into (template, slots).
+
+    Argument values (quoted text, emails, dates, times, urgencies, names and numbers)
+    are replaced by numbered placeholders such as <NAME_1>; the rest is lowercased with
+    single spaces. Commands of the same shape share a template, and `slots` maps each
+    placeholder to the value it replaced.
+    """
+    # Urgency words are arguments whatever their case; the other slot kinds are case-sensitive
+    command = _URGENCY_WORD.sub(lambda match: match.group().lower(), command)
+    parts = []
+    slots = {}
+    counts = {}
+    position = 0
+    for match in _SLOT_PATTERN.finditer(command):
+        parts.append(command[position:match.start()].lower())
+        kind = match.lastgroup
+        counts[kind] = counts.get(kind, 0) + 1
+        token = f"<{kind}_{counts[kind]}>"
+        value = match.group()
+        slots[token] = value[1:-1] if kind == "TEXT" else value
+        parts.append(token)
+        position = match.end()
+    parts.append(command[position:].lower())
+    template = re.sub(r"\s+", " ", "".join(parts)).strip().rstrip("?!. ")
+    return template, slots
+
+
+def planning_query(template):
+    """The query sent to the planner for a template."""
+    return f"{template}\n\n{PLANNING_NOTE}"
+
+
+def is_reusable(plan, slots):
+    """A plan can serve other commands of its shape if it uses every placeholder, or has no steps at all."""
+    if not plan.steps:
+        return True
+    dumped = json.dumps(plan.model_dump(mode="json"))
+    return all(token in dumped for token in slots)
+
+
+def _fill(value, slots):
+    if isinstance(value, str):
+        for token, replacement in slots.items():
+            value = value.replace(token, replacement)
+        return value
+    if isinstance(value, list):
+        return [_fill(item, slots) for item in value]
+    if isinstance(value, dict):
+        return {key: _fill(item, slots) for key, item in value.items()}
+    return value
+
+
+def fill_plan(plan, slots):
+    """Return a copy of a template plan with its placeholders replaced by this command's values.
+
+    The copy gets a fresh plan id, so every run is stored as a plan of its own.
+    """
+    data = _fill(plan.model_dump(mode="json"), slots)
+    data.pop("id", None)
+    return type(plan).model_validate(data)
+
+
+class PlanCache:
+    """Bounded LRU cache of Portia plans keyed by intent template (see normalize_intent).
+
+    Plans with no steps are cached too, so commands the planner cannot act on go
+    straight to the chat model next time. Thread-safe.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, template):
+        """Return the plan cached for a template, or None on a miss."""
+        with self._lock:
+            plan = self._entries.get(template)
+            if plan is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(template)
+            self.hits += 1
+            return plan
+
+    def put(self, template, plan):
+        with self._lock:
+            self._entries[template] = plan
+            self._entries.move_to_end(template)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
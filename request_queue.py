@@ -0,0 +1,307 @@
+import heapq
+import threading
+import uuid
+from array import array
+from datetime import datetime, timedelta, timezone
+from enum import IntEnum
+
+from indexed_store import CHANGE_LOG_LIMIT
+
+try:
+    import numpy as np
+except ImportError:
+    # Optional: without numpy, ranking falls back to a stable sorted() over the same columns
+    np = None
+
+
+class Urgency(IntEnum):
+    ROUTINE = 1
+    MODERATE = 2
+    URGENT = 3
+
+
+URGENCY_SCORES = {urgency.name.lower(): int(urgency) for urgency in Urgency}
+
+# Unparseable timestamps sort after every valid one; kept clear of the int64 minimum so it can be negated
+NO_TIMESTAMP = -(2 ** 62)
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_COLUMNS = frozenset(("id", "patient", "condition", "urgency", "email", "timestamp"))
+
+
+def urgency_score(urgency):
+    """Return the priority score for an urgency label (unknown labels count as routine)."""
+    return URGENCY_SCORES.get(urgency, Urgency.ROUTINE)
+
+
+def new_request_id():
+    return f"req-{uuid.uuid4().hex}"
+
+
+def _epoch_micros(timestamp):
+    """Return (int64 microseconds since the epoch, whether formatting them gives back `timestamp`).
+
+    Naive timestamps are read as UTC.
+    """
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return NO_TIMESTAMP, False
+    exact = moment.tzinfo is None and moment.isoformat() == timestamp
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - _EPOCH) // _MICROSECOND, exact
+
+
+class RequestQueue:
+    """Columnar queue of patient requests, highest priority first.
+
+    Requests are ordered by urgency, then timestamp (both descending), then
+    insertion order. Instead of one dict per request the queue keeps parallel
+    columns: urgency as an int8 enum, timestamps as int64 epoch microseconds, the
+    condition as an index into a table of distinct conditions, and the id, patient
+    and email strings. Dicts are only built for requests that are read back.
+
+    A heap of (-urgency, -timestamp, row) keys gives O(log n) push and pop; rows
+    increase with insertion, so ties keep insertion order. Bulk reads (ordered(),
+    draining most of the queue) instead rank the columns with one lexsort (numpy
+    when installed, sorted() otherwise). Removal tombstones a row, whose heap key
+    is skipped when it surfaces, and the columns are compacted once dead rows
+    outnumber live ones. Every push and removal is logged by id so a view can
+    fetch only what changed (see changes_since). All operations are guarded by a
+    lock so UI and worker threads can share a queue.
+    """
+
+    def __init__(self, requests=()):
+        self._lock = threading.RLock()
+        # The change log outlives _reset, since compaction keeps the same requests
+        self._changes = []
+        # Position of self._changes[0] in the full change history
+        self._changes_base = 0
+        self._reset()
+        self._extend(requests)
+        self._changes.extend(self._ids)
+        self._trim_changes()
+
+    def _reset(self):
+        self._urgency = array("b")
+        self._timestamp = array("q")
+        self._condition = array("I")
+        self._alive = bytearray()
+        self._ids = []
+        self._patients = []
+        self._emails = []
+        self._condition_names = []
+        self._condition_codes = {}
+        # Fields the columns cannot reproduce exactly, by row
+        self._extras = {}
+        self._rows = {}
+        self._heap = []
+
+    def _extend(self, requests):
+        # A heap built in one go costs O(n) instead of n pushes
+        self._heap.extend(self._add_row(request) for request in requests)
+        heapq.heapify(self._heap)
+
+    def _append(self, request):
+        key = self._add_row(request)
+        heapq.heappush(self._heap, key)
+        request_id = self._ids[key[2]]
+        self._changes.append(request_id)
+        return request_id
+
+    def _add_row(self, request):
+        """Store a request in the columns and return its heap key."""
+        request_id = request.setdefault("id", new_request_id())
+        if request_id in self._rows:
+            raise KeyError(f"Duplicate request id: {request_id}")
+        row = len(self._ids)
+        urgency = request.get("urgency")
+        timestamp = request.get("timestamp")
+        condition = request.get("condition")
+        code = self._condition_codes.get(condition)
+        if code is None:
+            code = self._condition_codes[condition] = len(self._condition_names)
+            self._condition_names.append(condition)
+
+        self._urgency.append(urgency_score(urgency))
+        micros, exact = _epoch_micros(timestamp)
+        self._timestamp.append(micros)
+        self._condition.append(code)
+        self._alive.append(1)
+        self._ids.append(request_id)
+        self._patients.append(request.get("patient"))
+        self._emails.append(request.get("email"))
+        self._rows[request_id] = row
+
+        if not exact or urgency not in URGENCY_SCORES or not _COLUMNS.issuperset(request):
+            extras = {key: value for key, value in request.items() if key not in _COLUMNS}
+            if urgency not in URGENCY_SCORES:
+                extras["urgency"] = urgency
+            if not exact:
+                extras["timestamp"] = timestamp
+            self._extras[row] = extras
+        return -self._urgency[row], -micros, row
+
+    def _request(self, row):
+        request = {
+            "id": self._ids[row],
+            "patient": self._patients[row],
+            "condition": self._condition_names[self._condition[row]],
+            "urgency": Urgency(self._urgency[row]).name.lower(),
+            "email": self._emails[row],
+        }
+        extras = self._extras.get(row)
+        if extras is None or "timestamp" not in extras:
+            request["timestamp"] = (_EPOCH + self._timestamp[row] * _MICROSECOND).isoformat()
+        if extras:
+            request.update(extras)
+        return request
+
+    def _kill(self, row):
+        self._alive[row] = 0
+        del self._rows[self._ids[row]]
+        self._changes.append(self._ids[row])
+        self._extras.pop(row, None)
+        # Drop the strings now; the fixed-width columns are reclaimed by _compact
+        self._patients[row] = self._emails[row] = None
+
+    def _trim_changes(self):
+        if len(self._changes) > CHANGE_LOG_LIMIT:
+            dropped = len(self._changes) - CHANGE_LOG_LIMIT // 2
+            del self._changes[:dropped]
+            self._changes_base += dropped
+
+    def _reclaim(self):
+        """Free the columns once dead rows outnumber live ones; an empty queue starts afresh."""
+        if not self._rows:
+            self._reset()
+        elif len(self._alive) > 2 * len(self._rows) + 1024:
+            self._compact()
+
+    def _compact(self):
+        live = [row for row, alive in enumerate(self._alive) if alive]
+        requests = [self._request(row) for row in live]
+        self._reset()
+        self._extend(requests)
+
+    def _ranking(self):
+        """Return the live row numbers in priority order, with one sort over the columns."""
+        if not self._ids:
+            return []
+        if np is not None:
+            urgency = np.frombuffer(self._urgency, dtype=np.int8)
+            timestamp = np.frombuffer(self._timestamp, dtype=np.int64)
+            # lexsort is stable and sorts by its last key first, so ties keep insertion order
+            order = np.lexsort((-timestamp, -urgency)).tolist()
+            # Release the views so the columns can grow again
+            del urgency, timestamp
+        else:
+            urgency, timestamp = self._urgency, self._timestamp
+            order = sorted(range(len(urgency)), key=lambda row: (-urgency[row], -timestamp[row]))
+        alive = self._alive
+        return [row for row in order if alive[row]]
+
+    def _next_row(self):
+        heap = self._heap
+        # Keys of removed rows are dropped lazily as they reach the top
+        while heap and not self._alive[heap[0][2]]:
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def push(self, request):
+        """Add a request and return its id."""
+        with self._lock:
+            request_id = self._append(request)
+            self._trim_changes()
+            return request_id
+
+    def pop(self):
+        """Remove and return the highest-priority request."""
+        with self._lock:
+            row = self._next_row()
+            if row is None:
+                raise IndexError("pop from an empty request queue")
+            heapq.heappop(self._heap)
+            request = self._request(row)
+            self._kill(row)
+            self._trim_changes()
+            self._reclaim()
+            return request
+
+    def pop_many(self, limit=None):
+        """Remove and return up to `limit` requests (all by default) in priority order."""
+        with self._lock:
+            count = len(self._rows) if limit is None else min(limit, len(self._rows))
+            if count > len(self._rows) // 4:
+                # Taking most of the queue: one sort beats count heap pops
+                rows = self._ranking()[:count]
+            else:
+                rows = []
+                for _ in range(count):
+                    rows.append(self._next_row())
+                    heapq.heappop(self._heap)
+            requests = []
+            for row in rows:
+                requests.append(self._request(row))
+                self._kill(row)
+            self._trim_changes()
+            self._reclaim()
+            return requests
+
+    def peek(self):
+        """Return the highest-priority request without removing it."""
+        with self._lock:
+            row = self._next_row()
+            if row is None:
+                raise IndexError("peek at an empty request queue")
+            return self._request(row)
+
+    def remove(self, request_id):
+        """Remove and return the request with the given id."""
+        with self._lock:
+            row = self._rows[request_id]
+            request = self._request(row)
+            self._kill(row)
+            self._trim_changes()
+            self._reclaim()
+            return request
+
+    def get(self, request_id, default=None):
+        with self._lock:
+            row = self._rows.get(request_id)
+            return self._request(row) if row is not None else default
+
+    def ordered(self, limit=None):
+        """Return up to `limit` requests in priority order without modifying the queue."""
+        with self._lock:
+            return [self._request(row) for row in self._ranking()[:limit]]
+
+    def changes_since(self, position):
+        """Return (requests added, ids removed, new position) for the changes after `position`.
+
+        If the changes after `position` were already trimmed from the log, every pending
+        request is returned and the removed ids are None: the reader should replace its view.
+        """
+        with self._lock:
+            end = self._changes_base + len(self._changes)
+            if position < self._changes_base:
+                return [self._request(row) for row in self._rows.values()], None, end
+            request_ids = dict.fromkeys(self._changes[position - self._changes_base:])
+            return (
+                [self._request(self._rows[request_id]) for request_id in request_ids if request_id in self._rows],
+                [request_id for request_id in request_ids if request_id not in self._rows],
+                end,
+            )
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, request_id):
+        return request_id in self._rows
+
+    def __iter__(self):
+        """Iterate over a snapshot of pending requests in insertion order."""
+        with self._lock:
+            return iter([self._request(row) for row in self._rows.values()])
@@ -0,0 +1,226 @@
+import itertools
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+
+from request_queue import new_request_id
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUESTS_LOG_PATH = os.path.join(BASE_DIR, "patient_requests.jsonl")
+
+# Demo requests used to seed the request log on first run
+SAMPLE_REQUESTS = [
+    {"patient": "John Doe", "condition": "chest pain", "urgency": "urgent", "email": "jimstse@gmail.com", "timestamp": "2025-04-12T08:00:00"},
+    {"patient": "Jane Smith", "condition": "annual checkup", "urgency": "routine", "email": "jane@example.com", "timestamp": "2025-04-12T08:05:00"},
+    {"patient": "Bob Lee", "condition": "diabetes follow-up", "urgency": "moderate", "email": "bob@example.com", "timestamp": "2025-04-12T08:10:00"}
+]
+
+# Every record starts with its op and id so the index can be built without parsing JSON.
+# Anchoring on the preceding newline lets the regex engine skip ahead with a literal search.
+# Ids that are not plain strings (escapes, numbers) leave the id group empty and are read with json.
+_FIRST_RECORD = re.compile(rb'\{"op":"(add|remove)","id":("[^"\\]*")?')
+_RECORD_HEADER = re.compile(rb'\n\{"op":"(add|remove)","id":("[^"\\]*")?')
+
+# Compact once dead records outnumber live ones (and there are at least this many)
+MIN_COMPACT_RECORDS = 1000
+
+
+class RequestStore:
+    """Durable append-only JSONL log of pending patient requests.
+
+    Each line is either {"op":"add","id":...,"request":{...}} or {"op":"remove","id":...}.
+    Loading memory-maps the log and builds an id -> byte offset index with a single
+    regex scan, then parses only the add records that are still live, so a long
+    history of scheduled (removed) requests costs almost nothing at startup. A last
+    line torn by a crash mid-append is truncated with a warning.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._offsets = {}
+        self._dead_records = 0
+        self._file = None
+
+    def load(self, seed=()):
+        """Index the log and return its live requests in insertion order.
+
+        If the log does not exist yet it is created from `seed`.
+        """
+        with self._lock:
+            if not os.path.exists(self.path):
+                requests = [dict(request) for request in seed]
+                self.append_many(requests)
+                return requests
+
+            self._repair_tail()
+            self._offsets, self._dead_records, requests = self._scan()
+            self._open()
+            logger.info(f"Loaded {len(requests)} pending requests from {self.path}")
+            return requests
+
+    def _repair_tail(self):
+        """Truncate a last line that is unterminated or not a valid record, as left by a crash mid-append."""
+        if os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "rb") as log, mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = data.rfind(b"\n", 0, len(data) - 1) + 1
+            line = data[start:]
+        try:
+            record = json.loads(line) if line.endswith(b"\n") else None
+        except ValueError:
+            record = None
+        if isinstance(record, dict) and record.get("op") in ("add", "remove"):
+            return
+        logger.warning(f"Truncating a torn record at byte {start} of {self.path}")
+        os.truncate(self.path, start)
+
+    def _scan(self):
+        """Return (live offsets by id, dead record count, live requests in insertion order)."""
+        offsets = {}
+        dead = 0
+        requests = []
+        if os.path.getsize(self.path) == 0:
+            return offsets, dead, requests
+        with open(self.path, "rb") as log, mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            first = _FIRST_RECORD.match(data)
+            for match in itertools.chain([first] if first else [], _RECORD_HEADER.finditer(data)):
+                start = match.start() if match is first else match.start() + 1
+                if match.group(2) is not None:
+                    request_id = match.group(2)[1:-1].decode()
+                else:
+                    try:
+                        request_id = json.loads(data[start:data.find(b"\n", start)])["id"]
+                    except (ValueError, KeyError):
+                        logger.warning(f"Skipping an unreadable record at byte {start} of {self.path}")
+                        dead += 1
+                        continue
+                if match.group(1) == b"add":
+                    # A repeated add supersedes the earlier one
+                    if offsets.pop(request_id, None) is not None:
+                        dead += 1
+                    offsets[request_id] = start
+                else:
+                    # The remove record and the add it cancels are both dead weight
+                    dead += 2 if offsets.pop(request_id, None) is not None else 1
+            # Live records are sliced straight from the map and parsed as one JSON array
+            lines = [data[offset:data.find(b"\n", offset)] for offset in offsets.values()]
+        try:
+            requests = [record["request"] for record in json.loads(b"[" + b",".join(lines) + b"]")]
+        except (ValueError, KeyError, TypeError):
+            # Some live record is damaged: parse them one by one and drop the bad ones
+            for (request_id, offset), line in zip(list(offsets.items()), lines):
+                try:
+                    requests.append(json.loads(line)["request"])
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Skipping an unreadable record at byte {offset} of {self.path}")
+                    del offsets[request_id]
+                    dead += 1
+        return offsets, dead, requests
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "ab")
+
+    def _write(self, records):
+        """Append encoded records, returning the byte offset of each."""
+        self._open()
+        offset = self._file.seek(0, os.SEEK_END)
+        offsets = []
+        for record in records:
+            offsets.append(offset)
+            self._file.write(record)
+            offset += len(record)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        return offsets
+
+    @staticmethod
+    def _encode(op, request_id, request=None):
+        header = f'{{"op":"{op}","id":{json.dumps(request_id)}'
+        if request is None:
+            return f"{header}}}\n".encode()
+        return f'{header},"request":{json.dumps(request, separators=(",", ":"))}}}\n'.encode()
+
+    def append(self, request):
+        """Persist one new request and return its id."""
+        return self.append_many([request])[0]
+
+    def append_many(self, requests):
+        """Persist new requests with a single write and fsync; returns their ids."""
+        with self._lock:
+            ids = [request.setdefault("id", new_request_id()) for request in requests]
+            records = [self._encode("add", request_id, request) for request_id, request in zip(ids, requests)]
+            for request_id, offset in zip(ids, self._write(records)):
+                self._offsets[request_id] = offset
+            return ids
+
+    def remove(self, request_id):
+        """Mark a request as no longer pending. Unknown ids are ignored."""
+        self.remove_many([request_id])
+
+    def remove_many(self, request_ids):
+        with self._lock:
+            live_ids = [request_id for request_id in request_ids if request_id in self._offsets]
+            if not live_ids:
+                return
+            self._write([self._encode("remove", request_id) for request_id in live_ids])
+            for request_id in live_ids:
+                del self._offsets[request_id]
+            self._dead_records += 2 * len(live_ids)
+            if self._dead_records >= max(MIN_COMPACT_RECORDS, len(self._offsets)):
+                self.compact()
+
+    def get(self, request_id):
+        """Read one live request back from disk through the offset index."""
+        with self._lock:
+            self._file.flush()
+            with open(self.path, "rb") as log:
+                log.seek(self._offsets[request_id])
+                return json.loads(log.readline())["request"]
+
+    def compact(self):
+        """Rewrite the log with only live add records, copied verbatim, and swap it in atomically."""
+        with self._lock:
+            self._file.close()
+            self._file = None
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".requests-", suffix=".tmp")
+            offsets = {}
+            try:
+                with os.fdopen(fd, "wb") as out, open(self.path, "rb") as log:
+                    for request_id, offset in self._offsets.items():
+                        log.seek(offset)
+                        offsets[request_id] = out.tell()
+                        out.write(log.readline())
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            finally:
+                self._open()
+            logger.info(f"Compacted {self.path}: dropped {self._dead_records} dead records")
+            self._offsets = offsets
+            self._dead_records = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, request_id):
+        return request_id in self._offsets
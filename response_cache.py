@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+def normalize_prompt(prompt):
+    """Reduce a prompt to a cache key: lowercase, single spaces, no trailing punctuation."""
+    return re.sub(r"\s+", " ", prompt).strip().lower().rstrip("?!. ")
+
+
+class ResponseCache:
+    """Bounded LRU cache of model responses with a per-entry TTL.
+
+    Keys are normalized prompts. When `path` is given the cache is loaded from and
+    saved to that JSON file so answers survive restarts. Thread-safe.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS, path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def get(self, prompt):
+        """Return the cached response for a prompt, or None on a miss or expired entry."""
+        key = normalize_prompt(prompt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, prompt, response):
+        self.put_many([(prompt, response)])
+
+    def put_many(self, items):
+        """Cache (prompt, response) pairs, saving to disk once for the lot."""
+        if not items:
+            return
+        with self._lock:
+            expires = time.time() + self.ttl_seconds
+            for prompt, response in items:
+                key = normalize_prompt(prompt)
+                self._entries[key] = (expires, response)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        if self.path:
+            self.save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self):
+        """Write unexpired entries to disk atomically, least recently used first."""
+        now = time.time()
+        with self._lock:
+            entries = [[key, expires, response] for key, (expires, response) in self._entries.items() if expires >= now]
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".cache-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _load(self):
+        try:
+            with open(self.path) as cache_file:
+                entries = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable response cache {self.path}: {str(e)}")
+            return
+        now = time.time()
+        for key, expires, response in entries[-self.max_entries:]:
+            if expires >= now:
+                self._entries[key] = (expires, response)
+        logger.info(f"Loaded {len(self._entries)} cached responses from {self.path}")
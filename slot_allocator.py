@@ -0,0 +1,191 @@
+import threading
+from datetime import datetime, timedelta
+
+# Default clinic configuration: 09:00-17:00 UTC, 30-minute slots, four providers
+CLINIC_OPEN = 9
+CLINIC_CLOSE = 17
+SLOT_MINUTES = 30
+PROVIDERS = 4
+
+# How many days ahead to look before giving up on finding a slot
+SEARCH_HORIZON_DAYS = 60
+
+
+class _DaySlots:
+    """Booking counts for one day's slots with a segment tree of the minimum count.
+
+    The tree finds the first slot at or after an index with spare capacity in O(log n).
+    """
+
+    def __init__(self, slot_count):
+        self.size = 1
+        while self.size < slot_count:
+            self.size *= 2
+        self.slot_count = slot_count
+        # Padding leaves are treated as full so they are never returned
+        self.tree = [0] * (2 * self.size)
+        for leaf in range(self.size + slot_count, 2 * self.size):
+            self.tree[leaf] = float("inf")
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = min(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def count(self, slot):
+        return self.tree[self.size + slot]
+
+    def add(self, slot, delta):
+        node = self.size + slot
+        self.tree[node] += delta
+        node //= 2
+        while node:
+            self.tree[node] = min(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def first_free(self, start, capacity, node=1, lo=0, hi=None):
+        """Return the first slot index >= start with fewer than `capacity` bookings, or None."""
+        if hi is None:
+            hi = self.size
+        if hi <= start or self.tree[node] >= capacity:
+            return None
+        if hi - lo == 1:
+            return lo
+        mid = (lo + hi) // 2
+        found = self.first_free(start, capacity, 2 * node, lo, mid)
+        if found is None:
+            found = self.first_free(start, capacity, 2 * node + 1, mid, hi)
+        return found
+
+
+class SlotAllocator:
+    """Hands out appointment slots within clinic hours, up to `providers` bookings per slot.
+
+    Occupancy is tracked per day in a segment tree, so finding the next free slot is
+    O(log slots per day) plus one step per fully booked day skipped. Thread-safe.
+    """
+
+    def __init__(self, open_hour=CLINIC_OPEN, close_hour=CLINIC_CLOSE, slot_minutes=SLOT_MINUTES, providers=PROVIDERS):
+        if close_hour <= open_hour or slot_minutes <= 0 or providers <= 0:
+            raise ValueError("Invalid clinic hours, slot length or provider count")
+        self.open_hour = open_hour
+        self.close_hour = close_hour
+        self.slot_length = timedelta(minutes=slot_minutes)
+        self.providers = providers
+        self.slots_per_day = (close_hour - open_hour) * 60 // slot_minutes
+        self._days = {}
+        self._full_days = set()
+        self._lock = threading.Lock()
+
+    def _day(self, day):
+        slots = self._days.get(day)
+        if slots is None:
+            slots = self._days[day] = _DaySlots(self.slots_per_day)
+        return slots
+
+    def _slot_start(self, day, slot):
+        return datetime.combine(day, datetime.min.time()).replace(hour=self.open_hour) + slot * self.slot_length
+
+    def _slot_index(self, moment):
+        """Index of the first slot starting at or after `moment` on its day."""
+        opening = moment.replace(hour=self.open_hour, minute=0, second=0, microsecond=0)
+        if moment <= opening:
+            return 0
+        elapsed = moment - opening
+        return -(-elapsed // self.slot_length)
+
+    def allocate(self, earliest):
+        """Book and return (start, end) of the first free slot starting at or after `earliest`."""
+        with self._lock:
+            day = earliest.date()
+            start_slot = self._slot_index(earliest)
+            for _ in range(SEARCH_HORIZON_DAYS):
+                if day not in self._full_days and start_slot < self.slots_per_day:
+                    slots = self._day(day)
+                    slot = slots.first_free(start_slot, self.providers)
+                    if slot is not None:
+                        slots.add(slot, 1)
+                        if slots.tree[1] >= self.providers:
+                            self._full_days.add(day)
+                        start = self._slot_start(day, slot)
+                        return start, start + self.slot_length
+                day += timedelta(days=1)
+                start_slot = 0
+            raise ValueError(f"No free slot within {SEARCH_HORIZON_DAYS} days of {earliest:%Y-%m-%d}")
+
+    def reserve(self, start):
+        """Mark an existing booking (e.g. loaded from the calendar) as occupying its slot."""
+        with self._lock:
+            slot = self._slot_index(start)
+            if slot < self.slots_per_day:
+                slots = self._day(start.date())
+                slots.add(slot, 1)
+                if slots.tree[1] >= self.providers:
+                    self._full_days.add(start.date())
+
+    def _span_slots(self, start, end):
+        """Yield (day, slot index) for every clinic slot overlapping [start, end)."""
+        day = start.date()
+        while day <= end.date():
+            opening = datetime.combine(day, datetime.min.time()).replace(hour=self.open_hour)
+            first = max(0, (start - opening) // self.slot_length) if day == start.date() else 0
+            for slot in range(first, self.slots_per_day):
+                if opening + slot * self.slot_length >= end:
+                    break
+                yield day, slot
+            day += timedelta(days=1)
+
+    def reserve_span(self, start, end):
+        """Mark every slot overlapping an existing event from `start` to `end` as taken by it."""
+        with self._lock:
+            for day, slot in self._span_slots(start, end):
+                slots = self._day(day)
+                slots.add(slot, 1)
+                if slots.tree[1] >= self.providers:
+                    self._full_days.add(day)
+
+    def release_span(self, start, end):
+        """Undo reserve_span, e.g. when the event was cancelled or moved."""
+        with self._lock:
+            for day, slot in self._span_slots(start, end):
+                slots = self._days.get(day)
+                if slots is not None and slots.count(slot) > 0:
+                    slots.add(slot, -1)
+                    self._full_days.discard(day)
+
+    def free_slots(self, day):
+        """Return (start, open places) for every slot on `day` that can still take a booking."""
+        with self._lock:
+            slots = self._days.get(day)
+            return [
+                (self._slot_start(day, slot), self.providers - (slots.count(slot) if slots else 0))
+                for slot in range(self.slots_per_day)
+                if slots is None or slots.count(slot) < self.providers
+            ]
+
+    def release(self, start):
+        """Free a previously allocated slot, e.g. after the calendar insert failed."""
+        with self._lock:
+            slot = self._slot_index(start)
+            slots = self._days.get(start.date())
+            if slots is not None and slot < self.slots_per_day and slots.count(slot) > 0:
+                slots.add(slot, -1)
+                self._full_days.discard(start.date())
+
+
+_default_allocator = None
+_default_lock = threading.Lock()
+
+
+def get_slot_allocator():
+    """Return the process-wide allocator shared by the scheduling tools."""
+    global _default_allocator
+    with _default_lock:
+        if _default_allocator is None:
+            _default_allocator = SlotAllocator()
+        return _default_allocator
+
+
+def configure_slot_allocator(**kwargs):
+    """Replace the process-wide allocator, e.g. to give a worker process a share of the providers."""
+    global _default_allocator
+    with _default_lock:
+        _default_allocator = SlotAllocator(**kwargs)
+        return _default_allocator
@@ -0,0 +1,179 @@
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from backends import BackendError, CalendarBackend
+from google_batch import DEFAULT_BATCH_SIZE
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Appointments are short; capping event length lets a full listing scan only the index entries near its start
+MAX_EVENT_LENGTH = timedelta(days=1)
+# Stay well under SQLite's limit on query parameters
+IN_CHUNK = 500
+
+_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def _utc_text(moment):
+    """Return a datetime or RFC 3339 string as naive UTC text, which sorts in time order."""
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime(_TIME_FORMAT)
+
+
+def _resource(row):
+    event_id, status, start, end, summary, description = row
+    return {
+        "id": event_id,
+        "status": status,
+        "summary": summary,
+        "description": description,
+        "start": {"dateTime": f"{start}Z", "timeZone": "UTC"},
+        "end": {"dateTime": f"{end}Z", "timeZone": "UTC"},
+    }
+
+
+class SQLiteCalendar(CalendarBackend):
+    """Calendars stored in one local SQLite file, for deployments without Google Calendar.
+
+    Events are indexed by (calendar, start time) for full listings and by (calendar,
+    change number) for incremental sync, whose tokens are change numbers. Each batch
+    of inserts is one transaction, and an event id that already exists is refused
+    with status 409 as Calendar does, so the outbox's fixed event ids work the same.
+    WAL mode lets threads and worker processes share the file. Thread-safe.
+    """
+
+    name = "sqlite"
+    rate_limited = False
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        # A connection must not cross a fork, so worker processes open their own
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Bookings are checkpointed in the outbox, so a lost last commit is recovered by the next run
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "calendar_id TEXT NOT NULL, id TEXT NOT NULL, seq INTEGER NOT NULL, status TEXT NOT NULL, "
+                "start_time TEXT NOT NULL, end_time TEXT NOT NULL, summary TEXT NOT NULL, description TEXT NOT NULL, "
+                "PRIMARY KEY (calendar_id, id)) WITHOUT ROWID"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS events_by_start ON events (calendar_id, start_time)")
+            connection.execute("CREATE INDEX IF NOT EXISTS events_by_seq ON events (calendar_id, seq)")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    @staticmethod
+    def _row(event):
+        """Validate an event resource and return its (id, start, end, summary, description), or raise BackendError."""
+        try:
+            start = _utc_text(event["start"]["dateTime"])
+            end = _utc_text(event["end"]["dateTime"])
+        except (KeyError, TypeError, ValueError):
+            raise BackendError(400, "Events need a start and end dateTime")
+        if end <= start:
+            raise BackendError(400, "The event ends before it starts")
+        if datetime.fromisoformat(end) - datetime.fromisoformat(start) > MAX_EVENT_LENGTH:
+            raise BackendError(400, f"Events may last at most {MAX_EVENT_LENGTH}")
+        return event.get("id") or uuid.uuid4().hex, start, end, event.get("summary", ""), event.get("description", "")
+
+    def insert_many(self, calendar_id, events, batch_size=DEFAULT_BATCH_SIZE):
+        results = []
+        for start in range(0, len(events), batch_size):
+            chunk = events[start:start + batch_size]
+            with span("sqlite_calendar.insert", calendar=calendar_id, size=len(chunk)):
+                results.extend(self._insert_batch(calendar_id, chunk))
+        return results
+
+    def _insert_batch(self, calendar_id, events):
+        results = []
+        rows = []
+        for event in events:
+            try:
+                rows.append(self._row(event))
+                results.append(None)
+            except BackendError as error:
+                results.append((None, error))
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                taken = self._existing_ids(connection, calendar_id, [row[0] for row in rows])
+                seq = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM events WHERE calendar_id = ?", (calendar_id,)).fetchone()[0]
+                inserted = []
+                rows = iter(rows)
+                for index, result in enumerate(results):
+                    if result is not None:
+                        continue
+                    event_id, start, end, summary, description = next(rows)
+                    if event_id in taken:
+                        results[index] = (None, BackendError(409, f"The requested identifier already exists: {event_id}"))
+                        continue
+                    taken.add(event_id)
+                    seq += 1
+                    inserted.append((calendar_id, event_id, seq, "confirmed", start, end, summary, description))
+                    results[index] = (_resource((event_id, "confirmed", start, end, summary, description)), None)
+                connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)", inserted)
+        return results
+
+    @staticmethod
+    def _existing_ids(connection, calendar_id, event_ids):
+        taken = set()
+        for start in range(0, len(event_ids), IN_CHUNK):
+            chunk = event_ids[start:start + IN_CHUNK]
+            rows = connection.execute(
+                f"SELECT id FROM events WHERE calendar_id = ? AND id IN ({','.join('?' * len(chunk))})", [calendar_id, *chunk]
+            )
+            taken.update(event_id for event_id, in rows)
+        return taken
+
+    def list_changes(self, calendar_id, sync_token=None, time_min=None):
+        with self._lock, span("sqlite_calendar.sync", calendar=calendar_id, incremental=bool(sync_token)):
+            connection = self._connect()
+            with connection:
+                # One read transaction, so the token matches the rows returned
+                connection.execute("BEGIN")
+                latest = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM events WHERE calendar_id = ?", (calendar_id,)).fetchone()[0]
+                if sync_token:
+                    try:
+                        since = int(sync_token)
+                    except ValueError:
+                        since = -1
+                    if not 0 <= since <= latest:
+                        raise BackendError(410, "Sync token is no longer valid, a full sync is required")
+                    rows = connection.execute(
+                        "SELECT id, status, start_time, end_time, summary, description FROM events "
+                        "WHERE calendar_id = ? AND seq > ? ORDER BY seq",
+                        (calendar_id, since),
+                    ).fetchall()
+                else:
+                    since = _utc_text(time_min) if time_min is not None else ""
+                    earliest = _utc_text(datetime.fromisoformat(since) - MAX_EVENT_LENGTH) if since else ""
+                    rows = connection.execute(
+                        "SELECT id, status, start_time, end_time, summary, description FROM events "
+                        "WHERE calendar_id = ? AND start_time >= ? AND end_time > ? AND status = 'confirmed' ORDER BY start_time",
+                        (calendar_id, earliest, since),
+                    ).fetchall()
+        return [_resource(row) for row in rows], str(latest)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
@@ -0,0 +1,57 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import calendar_shards
+from calendar_shards import CalendarShard, CalendarShards, configure_calendar_shards, get_calendar_shards
+from sqlite_calendar import SQLiteCalendar
+
+
+@pytest.fixture(autouse=True)
+def mirror_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("CALENDAR_MIRROR_DIR", str(tmp_path / "mirror"))
+
+
+@pytest.fixture
+def calendar(tmp_path):
+    calendar = SQLiteCalendar(str(tmp_path / "calendar.sqlite3"))
+    yield calendar
+    calendar.close()
+
+
+def tomorrow_at(hour, minute=0):
+    return datetime.combine(date.today() + timedelta(days=1), datetime.min.time()).replace(hour=hour, minute=minute)
+
+
+def test_existing_events_hold_their_slots_after_the_first_sync(calendar):
+    start = tomorrow_at(9)
+    event = {"start": {"dateTime": f"{start.isoformat()}Z"}, "end": {"dateTime": f"{(start + timedelta(minutes=30)).isoformat()}Z"}}
+    calendar.insert_many("primary", [event] * 2)
+    shard = CalendarShard("primary", providers=2)
+    assert shard.allocator.allocate(start)[0] == start
+    shard.allocator.release(start)
+
+    shard.sync_once(calendar)
+    assert shard.allocator.allocate(start)[0] == tomorrow_at(9, 30)
+    # Later calls do not list the calendar again
+    later = tomorrow_at(10)
+    calendar.insert("primary", {"start": {"dateTime": f"{later.isoformat()}Z"}, "end": {"dateTime": f"{(later + timedelta(minutes=30)).isoformat()}Z"}})
+    shard.sync_once(calendar)
+    assert (later, 2) in shard.allocator.free_slots(later.date())
+
+
+def test_shards_are_picked_by_a_stable_hash_of_the_key():
+    shards = CalendarShards(["a", "b", "c"], key="condition")
+    picked = shards.route({"condition": "Flu"})
+    assert shards.route({"condition": "flu", "patient": "Ann"}) is picked
+    groups = shards.group([{"condition": "flu"}, {"condition": "cold"}, {"condition": "FLU"}])
+    assert {0, 2} <= {index for index, _ in groups[picked]}
+
+
+def test_configure_calendar_shards_sets_providers_per_calendar(monkeypatch):
+    monkeypatch.setattr(calendar_shards, "_shards", None)
+    monkeypatch.setenv("CALENDAR_IDS", "a, b")
+    configured = configure_calendar_shards(providers=1)
+    assert get_calendar_shards() is configured
+    assert [shard.calendar_id for shard in configured.shards] == ["a", "b"]
+    assert all(shard.allocator.providers == 1 for shard in configured.shards)
@@ -0,0 +1,51 @@
+import socket
+
+from google_batch import execute_batched
+
+
+class FakeBatch:
+    """Answers every call by echoing its request, except on the batch numbers listed in `timeouts`."""
+
+    def __init__(self, callback, number, timeouts):
+        self.callback = callback
+        self.number = number
+        self.timeouts = timeouts
+        self.calls = []
+
+    def add(self, api_request, request_id):
+        self.calls.append((request_id, api_request))
+
+    def execute(self):
+        if self.number in self.timeouts:
+            # The connection drops after the first response has been read
+            request_id, api_request = self.calls[0]
+            self.callback(request_id, {"id": api_request}, None)
+            raise socket.timeout("timed out")
+        for request_id, api_request in self.calls:
+            self.callback(request_id, {"id": api_request}, None)
+
+
+class FakeService:
+    def __init__(self, timeouts=()):
+        self.timeouts = timeouts
+        self.batches = 0
+
+    def new_batch_http_request(self, callback):
+        self.batches += 1
+        return FakeBatch(callback, self.batches, self.timeouts)
+
+
+def test_results_come_back_in_request_order():
+    service = FakeService()
+    results = execute_batched(service, list("abcde"), batch_size=2)
+    assert results == [({"id": name}, None) for name in "abcde"]
+    assert service.batches == 3
+
+
+def test_a_transport_error_fails_only_the_unanswered_calls_of_its_batch():
+    service = FakeService(timeouts={2})
+    results = execute_batched(service, list("abcdefg"), batch_size=3)
+    assert [response for response, _ in results] == [{"id": "a"}, {"id": "b"}, {"id": "c"}, {"id": "d"}, None, None, {"id": "g"}]
+    errors = [error for _, error in results[4:6]]
+    assert all(isinstance(error, socket.timeout) for error in errors)
+    assert results[6][1] is None
@@ -0,0 +1,84 @@
+import re
+
+import pytest
+
+import outbox
+from outbox import DONE, STARTED, Outbox, configure_outbox, email_key, event_id, get_outbox, schedule_key
+from sqlite_calendar import SQLiteCalendar
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "outbox.sqlite3")
+
+
+def test_a_new_run_sees_the_steps_of_the_last_one(path):
+    first_run = Outbox(path)
+    first_run.mark_many(STARTED, [(schedule_key("a"), {"start": "2025-05-01T09:00:00"}), (schedule_key("b"), {})])
+    first_run.mark_many(DONE, [(schedule_key("a"), {"event_id": "ev1"})])
+    # The process dies here without closing anything
+
+    second_run = Outbox(path)
+    found = second_run.get_many([schedule_key("a"), schedule_key("b"), schedule_key("c"), None])
+    assert found == {
+        schedule_key("a"): (DONE, {"event_id": "ev1"}),
+        schedule_key("b"): (STARTED, {}),
+    }
+    assert len(second_run) == 2
+    first_run.close()
+    second_run.close()
+
+
+def test_forgotten_steps_are_gone(path):
+    store = Outbox(path)
+    store.mark_many(DONE, [(schedule_key("a"), {}), (email_key("a"), {}), (schedule_key("b"), {})])
+    store.forget_many([schedule_key("a"), email_key("a"), None])
+    assert list(store.get_many([schedule_key("a"), email_key("a"), schedule_key("b")])) == [schedule_key("b")]
+    store.forget_many([])
+    store.close()
+
+
+def test_get_many_handles_more_keys_than_sqlite_parameters(path):
+    store = Outbox(path)
+    keys = [email_key(index) for index in range(1200)]
+    store.mark_many(DONE, [(key, index) for index, key in enumerate(keys)])
+    found = store.get_many(keys)
+    assert len(found) == 1200
+    assert found[keys[1100]] == (DONE, 1100)
+    store.close()
+
+
+def test_event_ids_are_stable_and_valid_for_calendar():
+    first = event_id("primary", schedule_key("a"))
+    assert first == event_id("primary", schedule_key("a"))
+    assert first != event_id("other", schedule_key("a"))
+    assert first != event_id("primary", schedule_key("b"))
+    assert re.fullmatch(r"[a-v0-9]{5,1024}", first)
+
+
+def test_a_retried_booking_cannot_create_a_second_event(path, tmp_path):
+    calendar = SQLiteCalendar(str(tmp_path / "calendar.sqlite3"))
+    event = {
+        "id": event_id("primary", schedule_key("a")),
+        "start": {"dateTime": "2025-05-01T09:00:00Z"},
+        "end": {"dateTime": "2025-05-01T09:30:00Z"},
+    }
+    store = Outbox(path)
+    store.mark_many(STARTED, [(schedule_key("a"), {})])
+    calendar.insert("primary", event)
+    # Crash before the step is marked done: the rerun sees it started and inserts again
+    rerun = Outbox(path)
+    assert rerun.get_many([schedule_key("a")])[schedule_key("a")][0] == STARTED
+    created, error = calendar.insert_many("primary", [event])[0]
+    assert created is None and error.status == 409
+    assert len(calendar.list_changes("primary")[0]) == 1
+    for handle in (store, rerun, calendar):
+        handle.close()
+
+
+def test_configure_outbox_replaces_the_shared_outbox(path, monkeypatch):
+    monkeypatch.setattr(outbox, "_outbox", None)
+    configured = configure_outbox(path)
+    assert get_outbox() is configured
+    assert configured.path == path
+    configured.close()
@@ -0,0 +1,76 @@
+import logging
+import threading
+
+import pytest
+
+from pipeline import Stage, run_pipeline
+
+
+def test_every_item_flows_through_every_stage():
+    seen = []
+    lock = threading.Lock()
+
+    def collect(batch):
+        with lock:
+            seen.extend(batch)
+        return []
+
+    run_pipeline(
+        range(1000),
+        [
+            Stage("double", lambda batch: [item * 2 for item in batch], workers=3, batch_size=7),
+            Stage("increment", lambda batch: [item + 1 for item in batch], workers=2, batch_size=50),
+            Stage("collect", collect),
+        ],
+        queue_size=10,
+    )
+    assert sorted(seen) == [item * 2 + 1 for item in range(1000)]
+
+
+def test_a_failing_batch_is_logged_and_dropped(caplog):
+    seen = []
+
+    def fail_on_odd(batch):
+        if any(item % 2 for item in batch):
+            raise RuntimeError("boom")
+        return batch
+
+    with caplog.at_level(logging.ERROR, logger="pipeline"):
+        run_pipeline(
+            range(10),
+            [Stage("flaky", fail_on_odd, batch_size=1), Stage("collect", lambda batch: seen.extend(batch) or [])],
+        )
+    assert sorted(seen) == [0, 2, 4, 6, 8]
+    assert caplog.text.count("Pipeline stage flaky failed") == 5
+
+
+def test_downstream_starts_before_upstream_finishes():
+    first_item_done = threading.Event()
+    overlapped = []
+
+    def produce(batch):
+        # Later batches wait until the next stage has handled the first one
+        if batch != [0]:
+            overlapped.append(first_item_done.wait(timeout=5))
+        return batch
+
+    def consume(batch):
+        if 0 in batch:
+            first_item_done.set()
+        return []
+
+    run_pipeline(range(3), [Stage("produce", produce, batch_size=1), Stage("consume", consume, batch_size=1)], linger=0)
+    assert overlapped == [True, True]
+
+
+def test_no_items_finishes_at_once():
+    batches = []
+    run_pipeline([], [Stage("only", batches.append, workers=4)])
+    assert batches == []
+
+
+def test_stages_need_workers_and_a_batch_size():
+    with pytest.raises(ValueError):
+        Stage("empty", list, workers=0)
+    with pytest.raises(ValueError):
+        Stage("empty", list, batch_size=0)
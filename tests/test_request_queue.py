@@ -0,0 +1,122 @@
+import random
+
+import pytest
+
+from request_queue import RequestQueue, urgency_score
+
+
+def make_request(request_id, urgency="routine", timestamp="2025-04-12T08:00:00", **fields):
+    return {"id": request_id, "patient": f"Patient {request_id}", "condition": "checkup", "urgency": urgency,
+            "email": f"{request_id}@example.com", "timestamp": timestamp, **fields}
+
+
+def priority_order(requests):
+    # The reference ordering: two stable sorts give urgency, then newest, then insertion order
+    ranked = sorted(requests, key=lambda request: request["timestamp"], reverse=True)
+    ranked = sorted(ranked, key=lambda request: urgency_score(request["urgency"]), reverse=True)
+    return [request["id"] for request in ranked]
+
+
+def test_pops_by_urgency_then_newest_then_insertion_order():
+    queue = RequestQueue([
+        make_request("a", "routine", "2025-04-12T08:00:00"),
+        make_request("b", "urgent", "2025-04-12T08:00:00"),
+        make_request("c", "moderate", "2025-04-12T09:00:00"),
+        make_request("d", "urgent", "2025-04-12T09:00:00"),
+        make_request("e", "urgent", "2025-04-12T08:00:00"),
+    ])
+    assert [queue.pop()["id"] for _ in range(len(queue))] == ["d", "b", "e", "c", "a"]
+    with pytest.raises(IndexError):
+        queue.pop()
+
+
+def test_interleaved_push_and_pop_match_a_full_sort():
+    rng = random.Random(7)
+    queue = RequestQueue()
+    pending = []
+    for step in range(2000):
+        if pending and rng.random() < 0.4:
+            expected = priority_order(pending)[0]
+            assert queue.pop()["id"] == expected
+            pending = [request for request in pending if request["id"] != expected]
+        else:
+            request = make_request(
+                f"r{step}", rng.choice(["routine", "moderate", "urgent"]), f"2025-04-{rng.randint(10, 12)}T08:00:00"
+            )
+            queue.push(dict(request))
+            pending.append(request)
+    assert [request["id"] for request in queue.ordered()] == priority_order(pending)
+
+
+def test_pop_many_and_ordered_agree_after_removals_and_compaction():
+    requests = [make_request(f"r{i}", ["routine", "moderate", "urgent"][i % 3], f"2025-04-12T{i % 24:02d}:00:00") for i in range(3000)]
+    queue = RequestQueue([dict(request) for request in requests])
+    removed = {f"r{i}" for i in range(0, 3000, 2)}
+    for request_id in removed:
+        queue.remove(request_id)
+    remaining = [request for request in requests if request["id"] not in removed]
+    expected = priority_order(remaining)
+
+    assert len(queue) == len(remaining)
+    assert [request["id"] for request in queue.ordered(limit=10)] == expected[:10]
+    assert queue.peek()["id"] == expected[0]
+    assert [request["id"] for request in queue.pop_many(5)] == expected[:5]
+    assert [request["id"] for request in queue.pop_many()] == expected[5:]
+    assert len(queue) == 0
+
+
+def test_single_pops_reclaim_dead_rows():
+    queue = RequestQueue([make_request(f"r{i}") for i in range(5000)])
+    for _ in range(4000):
+        queue.pop()
+    # Dead rows are compacted away as they come to outnumber live ones
+    assert len(queue._alive) <= 2 * len(queue) + 1024
+    assert [request["id"] for request in queue.pop_many(2)] == ["r4000", "r4001"]
+
+    # A queue that is drained one request at a time starts afresh each time it empties
+    for step in range(3000):
+        queue.push(make_request(f"s{step}"))
+        queue.pop()
+    assert len(queue._alive) <= 2 * len(queue) + 1024
+
+
+def test_requests_round_trip_unchanged():
+    odd = make_request("odd", urgency="critical", timestamp="not a time", notes="bring x-rays")
+    aware = make_request("aware", timestamp="2025-04-12T08:00:00+02:00")
+    queue = RequestQueue([dict(odd), dict(aware)])
+    assert queue.get("odd") == odd
+    assert queue.get("aware") == aware
+    assert queue.get("missing") is None
+    assert "odd" in queue
+
+
+def test_duplicate_ids_are_refused():
+    queue = RequestQueue([make_request("a")])
+    with pytest.raises(KeyError):
+        queue.push(make_request("a"))
+    assert queue.push({"patient": "No Id"}).startswith("req-")
+
+
+def test_changes_since_reports_only_what_changed():
+    queue = RequestQueue([make_request("a"), make_request("b")])
+    added, removed, position = queue.changes_since(0)
+    assert [request["id"] for request in added] == ["a", "b"]
+    assert removed == []
+
+    queue.push(make_request("c"))
+    queue.remove("a")
+    added, removed, position = queue.changes_since(position)
+    assert [request["id"] for request in added] == ["c"]
+    assert removed == ["a"]
+    assert queue.changes_since(position)[:2] == ([], [])
+
+
+def test_changes_since_resyncs_a_reader_that_fell_behind(monkeypatch):
+    monkeypatch.setattr("request_queue.CHANGE_LOG_LIMIT", 10)
+    queue = RequestQueue()
+    for i in range(30):
+        queue.push(make_request(f"r{i}"))
+    queue.pop_many(25)
+    added, removed, _ = queue.changes_since(0)
+    assert removed is None
+    assert sorted(request["id"] for request in added) == sorted(request["id"] for request in queue)
@@ -0,0 +1,113 @@
+import logging
+
+from request_store import MIN_COMPACT_RECORDS, RequestStore
+
+
+def reopen(path):
+    store = RequestStore(str(path), fsync=False)
+    return store, store.load()
+
+
+def test_first_load_seeds_the_log(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    store, requests = reopen(path)
+    assert requests == []
+    store.close()
+
+    store = RequestStore(str(tmp_path / "seeded.jsonl"), fsync=False)
+    requests = store.load(seed=[{"patient": "Ann"}])
+    assert [request["patient"] for request in requests] == ["Ann"]
+    store.close()
+    assert reopen(tmp_path / "seeded.jsonl")[1] == requests
+
+
+def test_reload_returns_live_requests_in_insertion_order(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    store, _ = reopen(path)
+    ids = store.append_many([{"patient": name} for name in ("Ann", "Bob", "Cy", "Di")])
+    store.remove(ids[1])
+    store.remove("unknown")
+    store.append({"id": ids[1], "patient": "Bob again"})
+    store.close()
+
+    store, requests = reopen(path)
+    assert [request["patient"] for request in requests] == ["Ann", "Cy", "Di", "Bob again"]
+    assert store.get(ids[1])["patient"] == "Bob again"
+    assert len(store) == 4
+    store.close()
+
+
+def test_awkward_ids_survive_a_reload(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    store, _ = reopen(path)
+    ids = ['quote " inside', "back\\slash", "naïve", 42, "plain"]
+    store.append_many([{"id": request_id, "patient": str(request_id)} for request_id in ids])
+    store.remove(42)
+    store.close()
+
+    store, requests = reopen(path)
+    assert [request["id"] for request in requests] == ['quote " inside', "back\\slash", "naïve", "plain"]
+    assert 42 not in store
+    assert store.get("back\\slash")["patient"] == "back\\slash"
+    store.close()
+
+
+def test_compaction_keeps_only_live_records(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    store, _ = reopen(path)
+    ids = store.append_many([{"patient": f"P{i}"} for i in range(MIN_COMPACT_RECORDS)])
+    # Removing more than half makes dead records outnumber live ones and triggers a compaction
+    store.remove_many(ids[: MIN_COMPACT_RECORDS // 2 + 1])
+    live = ids[MIN_COMPACT_RECORDS // 2 + 1:]
+    assert len(path.read_bytes().splitlines()) == len(live)
+    assert store.get(live[0])["patient"] == f"P{MIN_COMPACT_RECORDS // 2 + 1}"
+
+    store.append({"patient": "After"})
+    store.close()
+    store, requests = reopen(path)
+    assert [request["id"] for request in requests][:-1] == live
+    assert requests[-1]["patient"] == "After"
+    store.close()
+
+
+def test_a_torn_last_line_is_truncated(tmp_path, caplog):
+    path = tmp_path / "requests.jsonl"
+    store, _ = reopen(path)
+    store.append_many([{"patient": "Ann"}, {"patient": "Bob"}])
+    store.close()
+    intact = path.read_bytes()
+    with open(path, "ab") as log:
+        log.write(b'{"op":"add","id":"torn","request":{"pati')
+
+    with caplog.at_level(logging.WARNING, logger="request_store"):
+        store, requests = reopen(path)
+    assert [request["patient"] for request in requests] == ["Ann", "Bob"]
+    assert "torn" in caplog.text
+    assert path.read_bytes() == intact
+
+    # New records start on a fresh line after the repair
+    store.append({"patient": "Cy"})
+    store.close()
+    assert [request["patient"] for request in reopen(path)[1]] == ["Ann", "Bob", "Cy"]
+
+
+def test_a_garbled_last_line_is_truncated(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    store, _ = reopen(path)
+    store.append({"patient": "Ann"})
+    store.close()
+    with open(path, "ab") as log:
+        log.write(b"\x00\x00\x00\x00\n")
+
+    store, requests = reopen(path)
+    assert [request["patient"] for request in requests] == ["Ann"]
+    store.close()
+
+
+def test_a_log_holding_only_a_torn_line_loads_empty(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    path.write_bytes(b'{"op":"add","id":"x"')
+    store, requests = reopen(path)
+    assert requests == []
+    assert path.read_bytes() == b""
+    store.close()
@@ -0,0 +1,85 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from slot_allocator import SEARCH_HORIZON_DAYS, SlotAllocator, _DaySlots
+
+
+def test_first_free_matches_a_linear_scan():
+    rng = random.Random(3)
+    for slot_count in (1, 5, 16, 17):
+        slots = _DaySlots(slot_count)
+        counts = [0] * slot_count
+        for _ in range(300):
+            slot = rng.randrange(slot_count)
+            delta = 1 if counts[slot] == 0 or rng.random() < 0.6 else -1
+            slots.add(slot, delta)
+            counts[slot] += delta
+            start, capacity = rng.randrange(slot_count + 1), rng.randint(1, 3)
+            expected = next((index for index in range(start, slot_count) if counts[index] < capacity), None)
+            assert slots.first_free(start, capacity) == expected
+
+
+def test_each_slot_takes_one_booking_per_provider():
+    allocator = SlotAllocator(open_hour=9, close_hour=10, slot_minutes=30, providers=2)
+    day = datetime(2025, 5, 1, 8, 0)
+    starts = [allocator.allocate(day)[0] for _ in range(4)]
+    assert starts == [datetime(2025, 5, 1, 9, 0)] * 2 + [datetime(2025, 5, 1, 9, 30)] * 2
+    # The day is full, so the next booking moves to the following morning
+    start, end = allocator.allocate(day)
+    assert (start, end) == (datetime(2025, 5, 2, 9, 0), datetime(2025, 5, 2, 9, 30))
+
+
+def test_allocation_starts_at_the_next_slot_boundary():
+    allocator = SlotAllocator(providers=1)
+    assert allocator.allocate(datetime(2025, 5, 1, 10, 10))[0] == datetime(2025, 5, 1, 10, 30)
+    assert allocator.allocate(datetime(2025, 5, 1, 10, 30))[0] == datetime(2025, 5, 1, 11, 0)
+    # After closing time the search continues the next day
+    assert allocator.allocate(datetime(2025, 5, 1, 17, 0))[0] == datetime(2025, 5, 2, 9, 0)
+
+
+def test_release_and_reserve_change_occupancy():
+    allocator = SlotAllocator(open_hour=9, close_hour=10, slot_minutes=30, providers=1)
+    earliest = datetime(2025, 5, 1, 9, 0)
+    allocator.reserve(datetime(2025, 5, 1, 9, 0))
+    start, _ = allocator.allocate(earliest)
+    assert start == datetime(2025, 5, 1, 9, 30)
+
+    allocator.release(datetime(2025, 5, 1, 9, 0))
+    assert allocator.allocate(earliest)[0] == datetime(2025, 5, 1, 9, 0)
+    # Releasing a free slot does nothing
+    allocator.release(datetime(2025, 5, 3, 9, 0))
+    assert allocator.free_slots(date(2025, 5, 3)) == [(datetime(2025, 5, 3, 9, 0), 1), (datetime(2025, 5, 3, 9, 30), 1)]
+
+
+def test_spans_block_every_slot_they_overlap():
+    allocator = SlotAllocator(open_hour=9, close_hour=12, slot_minutes=30, providers=2)
+    day = date(2025, 5, 1)
+    allocator.reserve_span(datetime(2025, 5, 1, 9, 45), datetime(2025, 5, 1, 10, 45))
+    assert allocator.free_slots(day) == [
+        (datetime(2025, 5, 1, 9, 0), 2),
+        (datetime(2025, 5, 1, 9, 30), 1),
+        (datetime(2025, 5, 1, 10, 0), 1),
+        (datetime(2025, 5, 1, 10, 30), 1),
+        (datetime(2025, 5, 1, 11, 0), 2),
+        (datetime(2025, 5, 1, 11, 30), 2),
+    ]
+    allocator.release_span(datetime(2025, 5, 1, 9, 45), datetime(2025, 5, 1, 10, 45))
+    assert all(places == 2 for _, places in allocator.free_slots(day))
+
+
+def test_a_fully_booked_horizon_raises():
+    allocator = SlotAllocator(open_hour=9, close_hour=10, slot_minutes=60, providers=1)
+    first = datetime(2025, 5, 1, 9, 0)
+    for offset in range(SEARCH_HORIZON_DAYS):
+        allocator.allocate(first + timedelta(days=offset))
+    with pytest.raises(ValueError):
+        allocator.allocate(first)
+
+
+def test_invalid_configuration_is_refused():
+    with pytest.raises(ValueError):
+        SlotAllocator(open_hour=17, close_hour=9)
+    with pytest.raises(ValueError):
+        SlotAllocator(providers=0)
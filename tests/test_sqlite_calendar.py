@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from backends import BackendError
+from sqlite_calendar import SQLiteCalendar
+
+
+@pytest.fixture
+def calendar(tmp_path):
+    calendar = SQLiteCalendar(str(tmp_path / "calendar.sqlite3"))
+    yield calendar
+    calendar.close()
+
+
+def event(start, end, event_id=None, summary="Appointment"):
+    resource = {"summary": summary, "description": "", "start": {"dateTime": start}, "end": {"dateTime": end}}
+    if event_id:
+        resource["id"] = event_id
+    return resource
+
+
+def test_inserted_events_come_back_in_utc(calendar):
+    created = calendar.insert("primary", event("2025-05-01T11:00:00+02:00", "2025-05-01T11:30:00+02:00", "ev1"))
+    assert created["id"] == "ev1"
+    assert created["start"]["dateTime"] == "2025-05-01T09:00:00Z"
+    assert created["status"] == "confirmed"
+
+    listed, _ = calendar.list_changes("primary")
+    assert [item["id"] for item in listed] == ["ev1"]
+    assert calendar.list_changes("other")[0] == []
+    assert calendar.insert("primary", event("2025-05-01T10:00:00Z", "2025-05-01T10:30:00Z"))["id"]
+
+
+def test_existing_ids_are_refused_with_409(calendar):
+    calendar.insert("primary", event("2025-05-01T09:00:00Z", "2025-05-01T09:30:00Z", "ev1"))
+    results = calendar.insert_many("primary", [
+        event("2025-05-01T10:00:00Z", "2025-05-01T10:30:00Z", "ev1"),
+        event("2025-05-01T10:00:00Z", "2025-05-01T10:30:00Z", "ev2"),
+        event("2025-05-01T11:00:00Z", "2025-05-01T11:30:00Z", "ev2"),
+    ])
+    assert [error.status if error else None for _, error in results] == [409, None, 409]
+    # The same id on another calendar is a different event
+    assert calendar.insert("other", event("2025-05-01T09:00:00Z", "2025-05-01T09:30:00Z", "ev1"))["id"] == "ev1"
+    with pytest.raises(BackendError) as refused:
+        calendar.insert("primary", event("2025-05-01T09:00:00Z", "2025-05-01T09:30:00Z", "ev1"))
+    assert refused.value.status == 409
+
+
+@pytest.mark.parametrize("resource", [
+    event("2025-05-01T10:00:00Z", "2025-05-01T09:00:00Z"),
+    event("2025-05-01T10:00:00Z", "2025-05-03T10:00:00Z"),
+    event("not a time", "2025-05-01T10:00:00Z"),
+    {"summary": "No times"},
+])
+def test_invalid_events_are_refused_with_400(calendar, resource):
+    (created, error), = calendar.insert_many("primary", [resource])
+    assert created is None
+    assert error.status == 400
+
+
+def test_a_bad_event_does_not_sink_its_batch(calendar):
+    results = calendar.insert_many("primary", [
+        event("2025-05-01T09:00:00Z", "2025-05-01T09:30:00Z", "ev1"),
+        {"summary": "No times"},
+        event("2025-05-01T10:00:00Z", "2025-05-01T10:30:00Z", "ev2"),
+    ], batch_size=2)
+    assert [created["id"] if created else error.status for created, error in results] == ["ev1", 400, "ev2"]
+
+
+def test_incremental_sync_returns_only_new_events(calendar):
+    calendar.insert("primary", event("2025-05-01T09:00:00Z", "2025-05-01T09:30:00Z", "ev1"))
+    _, token = calendar.list_changes("primary")
+    assert calendar.list_changes("primary", sync_token=token) == ([], token)
+
+    calendar.insert("primary", event("2025-05-02T09:00:00Z", "2025-05-02T09:30:00Z", "ev2"))
+    changed, next_token = calendar.list_changes("primary", sync_token=token)
+    assert [item["id"] for item in changed] == ["ev2"]
+    assert next_token != token
+
+
+@pytest.mark.parametrize("token", ["999", "-1", "garbage"])
+def test_unknown_sync_tokens_need_a_full_sync(calendar, token):
+    calendar.insert("primary", event("2025-05-01T09:00:00Z", "2025-05-01T09:30:00Z", "ev1"))
+    with pytest.raises(BackendError) as expired:
+        calendar.list_changes("primary", sync_token=token)
+    assert expired.value.status == 410
+
+
+def test_full_listing_skips_events_that_ended_before_time_min(calendar):
+    calendar.insert_many("primary", [
+        event("2025-05-01T09:00:00Z", "2025-05-01T09:30:00Z", "past"),
+        event("2025-05-01T23:30:00Z", "2025-05-02T00:30:00Z", "overnight"),
+        event("2025-05-02T09:00:00Z", "2025-05-02T09:30:00Z", "next"),
+    ])
+    listed, _ = calendar.list_changes("primary", time_min=datetime(2025, 5, 2, tzinfo=timezone.utc))
+    assert [item["id"] for item in listed] == ["overnight", "next"]
+
+
+def test_events_persist_across_connections(tmp_path):
+    path = str(tmp_path / "calendar.sqlite3")
+    first = SQLiteCalendar(path)
+    first.insert("primary", event("2025-05-01T09:00:00Z", "2025-05-01T09:30:00Z", "ev1"))
+    first.close()
+    second = SQLiteCalendar(path)
+    assert [item["id"] for item in second.list_changes("primary")[0]] == ["ev1"]
+    second.close()
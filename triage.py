@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import re
+import threading
+
+from metrics import metrics, span
+from request_queue import URGENCY_SCORES, Urgency
+from response_cache import ResponseCache, normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TRIAGE_CACHE_PATH = os.path.join(BASE_DIR, "triage_cache.json")
+
+# "off": keep stated urgencies; "unknown": classify requests whose urgency is missing or
+# unrecognized; "all": classify every request and keep the higher of stated and triaged
+TRIAGE_MODES = ("off", "unknown", "all")
+DEFAULT_TRIAGE_MODE = "unknown"
+TRIAGE_MODEL = "gemini-1.5-flash"
+# Distinct conditions classified per model call
+DEFAULT_TRIAGE_BATCH = 100
+# Triage of a condition does not go stale quickly; keep it for 30 days
+TRIAGE_TTL_SECONDS = 30 * 24 * 60 * 60
+TRIAGE_CACHE_ENTRIES = 20000
+
+# Offline fallback: the first urgency with a keyword in the condition wins
+KEYWORDS = {
+    "urgent": (
+        "chest pain", "crushing", "can't breathe", "cannot breathe", "shortness of breath", "difficulty breathing",
+        "stroke", "slurred", "unconscious", "fainted", "seizure", "severe bleeding", "bleeding heavily",
+        "overdose", "suicidal", "anaphylaxis", "allergic reaction", "heart attack", "severe", "sudden",
+    ),
+    "moderate": (
+        "fever", "infection", "vomiting", "fracture", "broken", "bleeding", "sprain", "injury", "rash", "migraine", "pain",
+        "swelling", "follow-up", "follow up", "burn", "wound", "asthma", "dizzy", "dizziness",
+    ),
+}
+
+PROMPT = (
+    "You are triaging patient appointment requests. Classify the urgency of each condition below "
+    "as exactly one of: urgent, moderate, routine. Reply with only a JSON object that maps each "
+    "condition's number to its urgency, for example {\"1\": \"routine\"}.\n\n"
+)
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def keyword_urgency(condition):
+    """Classify a condition with the local keyword model."""
+    text = normalize_prompt(condition or "")
+    for urgency, keywords in KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return urgency
+    return "routine"
+
+
+class Triage:
+    """Classifies condition text into urgency labels, many conditions per Gemini call.
+
+    Results are cached per normalized condition, so bulk intake costs one model call
+    per batch of distinct, unseen conditions. When the model is unavailable or its
+    reply cannot be read, the local keyword model answers instead; those answers are
+    not cached, so the model is asked again once it is back.
+    """
+
+    def __init__(self, cache=None, batch_size=DEFAULT_TRIAGE_BATCH, model=None):
+        self.cache = cache if cache is not None else ResponseCache(max_entries=TRIAGE_CACHE_ENTRIES, ttl_seconds=TRIAGE_TTL_SECONDS)
+        self.batch_size = batch_size
+        self._model = model
+        self._model_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                api_key = os.getenv("GOOGLE_API_KEY")
+                if not api_key:
+                    raise RuntimeError("GOOGLE_API_KEY is not set")
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                self._model = genai.GenerativeModel(TRIAGE_MODEL)
+            return self._model
+
+    def classify_many(self, conditions):
+        """Return {normalized condition: urgency label} for every condition given."""
+        labels = {}
+        unseen = []
+        for condition in dict.fromkeys(normalize_prompt(condition or "") for condition in conditions):
+            cached = self.cache.get(condition)
+            if cached is not None:
+                labels[condition] = cached
+            else:
+                unseen.append(condition)
+        for start in range(0, len(unseen), self.batch_size):
+            labels.update(self._classify_batch(unseen[start:start + self.batch_size]))
+        return labels
+
+    def _classify_batch(self, conditions):
+        prompt = PROMPT + "\n".join(f"{number}. {condition}" for number, condition in enumerate(conditions, 1))
+        answers = {}
+        try:
+            with span("gemini.triage", size=len(conditions)):
+                reply = self._get_model().generate_content(prompt).text
+            answers = json.loads(_FENCE.sub("", reply.strip()))
+            if not isinstance(answers, dict):
+                raise ValueError("expected a JSON object")
+        except Exception as e:
+            logger.warning(f"Triage model unavailable, using keywords for {len(conditions)} conditions: {str(e)}")
+            answers = {}
+
+        labels = {}
+        classified = []
+        for number, condition in enumerate(conditions, 1):
+            label = str(answers.get(str(number), "")).strip().lower()
+            if label in URGENCY_SCORES:
+                labels[condition] = label
+                classified.append((condition, label))
+            else:
+                metrics.increment("triage_fallbacks")
+                labels[condition] = keyword_urgency(condition)
+        self.cache.put_many(classified)
+        return labels
+
+
+_triage = None
+_triage_lock = threading.Lock()
+
+
+def get_triage():
+    """Return the process-wide triage, caching its results in triage_cache.json."""
+    global _triage
+    with _triage_lock:
+        if _triage is None:
+            _triage = Triage(ResponseCache(max_entries=TRIAGE_CACHE_ENTRIES, ttl_seconds=TRIAGE_TTL_SECONDS, path=TRIAGE_CACHE_PATH))
+        return _triage
+
+
+def triage_mode():
+    mode = os.getenv("URGENCY_TRIAGE", DEFAULT_TRIAGE_MODE).strip().lower()
+    if mode not in TRIAGE_MODES:
+        logger.warning(f"Unknown URGENCY_TRIAGE {mode!r}, using {DEFAULT_TRIAGE_MODE!r}")
+        return DEFAULT_TRIAGE_MODE
+    return mode
+
+
+def triage_requests(requests, mode=None):
+    """Set the urgency of requests from their condition text, in place, according to `mode`.
+
+    `mode` defaults to the URGENCY_TRIAGE setting (see TRIAGE_MODES). A request whose
+    urgency changes keeps what was stated under "stated_urgency". Returns how many
+    requests changed.
+    """
+    mode = mode or triage_mode()
+    if mode == "off":
+        return 0
+    if mode == "unknown":
+        requests = [request for request in requests if request.get("urgency") not in URGENCY_SCORES]
+    if not requests:
+        return 0
+
+    labels = get_triage().classify_many(request.get("condition") for request in requests)
+    changed = 0
+    for request in requests:
+        label = labels[normalize_prompt(request.get("condition") or "")]
+        stated = request.get("urgency")
+        # Triage only ever raises a stated urgency
+        if stated in URGENCY_SCORES and Urgency[stated.upper()] >= Urgency[label.upper()]:
+            continue
+        if stated:
+            request["stated_urgency"] = stated
+        request["urgency"] = label
+        changed += 1
+    return changed